@@ -0,0 +1,70 @@
+"""
+Offline HTML parsing benchmark for the Vinmec crawler.
+
+Parses saved pages (listing and article HTML, one page per *.html file) the
+way the crawler does and reports pages/sec for each parser backend and
+worker count. Save fixtures with e.g.:
+    curl -o fixtures/article_1.html https://www.vinmec.com/vie/bai-viet/...
+
+Usage:
+    python crawl_data/parse_benchmark.py fixtures/ --parsers html.parser lxml --workers 0 2 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from vinmec_crawl_data import parse_article_links, parse_article_content
+
+BASE_URL = "https://www.vinmec.com/vie/benchmark/page_0"
+
+
+def parse_page(html, parser):
+    """Everything the crawler parses per page: listing links and article content"""
+    return parse_article_links(html, BASE_URL, parser), parse_article_content(html, BASE_URL, "benchmark", parser)
+
+
+def run(pages, parser, workers, repeat):
+    jobs = pages * repeat
+    start_time = time.perf_counter()
+    if workers == 0:
+        results = [parse_page(html, parser) for html in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Start the workers before timing so process spawn is not counted
+            list(executor.map(int, range(workers)))
+            start_time = time.perf_counter()
+            results = list(executor.map(parse_page, jobs, [parser] * len(jobs), chunksize=4))
+    elapsed = time.perf_counter() - start_time
+    return len(jobs) / elapsed, results[:len(pages)]
+
+
+def main(args):
+    pages = []
+    for name in sorted(os.listdir(args.fixtures)):
+        if name.endswith(".html"):
+            with open(os.path.join(args.fixtures, name), encoding="utf-8") as f:
+                pages.append(f.read())
+    if not pages:
+        raise SystemExit(f"No *.html fixtures in {args.fixtures}")
+    print(f"{len(pages)} fixtures x {args.repeat} repeats")
+
+    reference = None
+    for parser in args.parsers:
+        for workers in args.workers:
+            pages_per_sec, results = run(pages, parser, workers, args.repeat)
+            # Every backend must produce the same links and article dicts
+            if reference is None:
+                reference = results
+            status = "ok" if results == reference else "OUTPUT DIFFERS"
+            print(f"parser={parser:<12} workers={workers:<3} {pages_per_sec:8.1f} pages/sec  {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crawler HTML parsing")
+    parser.add_argument("fixtures", type=str, help="Directory of saved *.html pages")
+    parser.add_argument("--parsers", nargs="+", default=["html.parser", "lxml"], help="BeautifulSoup parser backends")
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 2, 4],
+                        help="Process pool sizes to try (0 = parse in the main process)")
+    parser.add_argument("--repeat", type=int, default=5, help="Times each fixture is parsed")
+    main(parser.parse_args())
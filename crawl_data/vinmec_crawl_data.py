@@ -9,6 +9,19 @@ from urllib.parse import urljoin
 from datetime import datetime, timedelta
 import functools
 import random 
+import argparse
+import gzip
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+_newlines = re.compile(r'\n+')
+_booking_text = re.compile(r'Để đặt lịch khám tại viện,.*?ứng dụng\.')
 
 def timing_decorator(func):
     @functools.wraps(func)
@@ -34,8 +47,191 @@ def timing_decorator(func):
         return async_wrapper
     return sync_wrapper
 
+def parse_retry_after(value):
+    """Seconds from a Retry-After header, None if absent or not a number"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def parse_article_links(html, base_url, parser=DEFAULT_PARSER):
+    """Article URLs on a listing page. Module-level so it can run in a worker process."""
+    soup = BeautifulSoup(html, parser)
+    article_links = []
+    for section in soup.find_all('div', class_='flex list_four_new mini-post'):
+        for link in section.find_all('a', href=True):
+            url = urljoin(base_url, link['href'])
+            if "/bai-viet/" in url and url not in article_links:
+                article_links.append(url)
+    return article_links
+
+def parse_article_content(html, url, tag, parser=DEFAULT_PARSER):
+    """Article dict {url, title, content, tag}, or None if the page is not an article"""
+    soup = BeautifulSoup(html, parser)
+    title_element = soup.find('h1', class_='single-title single-title-line')
+    if not title_element:
+        return None
+    
+    title = title_element.text.strip()
+    content_element = soup.find('div', id='main-article', class_='entry')
+    if not content_element:
+        return None
+        
+    # Remove unwanted elements
+    for element in content_element.find_all(['script', 'style', 'iframe', 'section']):
+        element.decompose()
+    
+    # Extract text from paragraphs and headings
+    text = "\n".join(element.get_text(strip=True)
+                     for element in content_element.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li']))
+    
+    # Clean up text
+    text = text.strip()
+    text = _newlines.sub('\n', text)
+    
+    # Remove booking text
+    text = _booking_text.sub('', text)
+    
+    # Include the tag in the article dictionary
+    return {'url': url, 'title': title, 'content': text, 'tag': tag}
+
+class HttpCache:
+    """
+    On-disk cache of fetched pages for conditional GETs. Each URL keeps a
+    gzip-compressed body and a small JSON file with its ETag/Last-Modified.
+    The crawler uses the async methods, which do the file IO and compression
+    in a worker thread so the event loop keeps fetching.
+    """
+    # Fast compression: HTML still shrinks ~5x and the CPU cost stays small
+    COMPRESSLEVEL = 2
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.not_modified = 0
+        self.downloaded = 0
+        self.bytes_saved = 0
+    
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+    
+    def validators(self, url):
+        """Conditional request headers for `url`, empty if it is not cached"""
+        try:
+            with open(self._path(url) + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+    
+    def load(self, url):
+        """Cached body after a 304, None if it is missing"""
+        try:
+            with gzip.open(self._path(url) + '.html.gz', 'rt', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def store(self, url, body, etag, last_modified):
+        if not (etag or last_modified):
+            return
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Body first, then metadata, so validators never point at a missing body
+        with gzip.open(path + '.html.gz.tmp', 'wt', encoding='utf-8', compresslevel=self.COMPRESSLEVEL) as f:
+            f.write(body)
+        os.replace(path + '.html.gz.tmp', path + '.html.gz')
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'etag': etag, 'last_modified': last_modified,
+                       'fetched_at': datetime.now().isoformat()}, f)
+        os.replace(path + '.json.tmp', path + '.json')
+    
+    async def avalidators(self, url):
+        return await asyncio.to_thread(self.validators, url)
+    
+    async def aload(self, url):
+        body = await asyncio.to_thread(self.load, url)
+        if body is not None:
+            self.not_modified += 1
+            self.bytes_saved += len(body.encode('utf-8'))
+        return body
+    
+    async def astore(self, url, body, headers):
+        self.downloaded += 1
+        await asyncio.to_thread(self.store, url, body, headers.get('ETag'), headers.get('Last-Modified'))
+    
+    def summary(self):
+        return (f"HTTP cache: {self.not_modified} not modified, {self.downloaded} downloaded, "
+                f"{self.bytes_saved / 1e6:.1f} MB not re-downloaded")
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every request of a crawl. The refill rate is halved
+    (and requests paused) on 429/5xx responses and recovers step by step on
+    successful ones. The rate is halved at most once per cooldown window
+    (Retry-After, or one request interval), and throttled responses to
+    requests sent before the last decrease are not counted again.
+    """
+    def __init__(self, rate=5.0, burst=None, min_rate=0.5, recover_step=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.recover_step = recover_step * rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.decreased_at = float('-inf')
+        self.cooldown_until = float('-inf')
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def backoff(self, retry_after=None, sent_at=None):
+        """sent_at: time.monotonic() when the throttled request was sent"""
+        now = time.monotonic()
+        if (sent_at is not None and sent_at < self.decreased_at) or now < self.cooldown_until:
+            # Same burst as the last decrease: honour Retry-After but keep the rate
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self.updated = max(self.updated, self.paused_until)
+            return
+        self.rate = max(self.min_rate, self.rate / 2)
+        delay = retry_after if retry_after is not None else 1.0 / self.rate
+        self.decreased_at = now
+        self.cooldown_until = now + delay
+        self.paused_until = max(self.paused_until, now + delay)
+        self.tokens = 0
+        self.updated = self.paused_until
+        print(f"Backing off: {self.rate:.2f} req/s, pausing {delay:.1f}s")
+    
+    def recover(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.recover_step)
+
 class VinmecScraper:
-    def __init__(self, base_url, tag, output_file="all_articles.json", max_concurrency=5):
+    def __init__(self, base_url, tag, output_file="all_articles.json", max_concurrency=5,
+                 rate_limiter=None, semaphore=None, max_retries=3, parser=DEFAULT_PARSER, executor=None,
+                 http_cache=None):
         self.base_url = base_url
         self.tag = tag  # Add tag property to the scraper
         self.output_file = output_file
@@ -53,67 +249,84 @@ class VinmecScraper:
             "Mozilla/5.0 (iPad; CPU OS 16_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Mobile/15E148 Safari/604.1"
         ]
         self.headers = {'User-Agent': random.choice(self.user_agents)}
-        self.semaphore = asyncio.Semaphore(max_concurrency)  # Control concurrency
+        # Control concurrency; a crawl of several categories passes one shared semaphore
+        self.semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        # HTML is parsed in this process pool when given, otherwise inline
+        self.parser = parser
+        self.executor = executor
+        self.http_cache = http_cache
         os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
     
     async def get_page(self, session, url):
-        try:
-            async with self.semaphore:  # Limit concurrent requests
-                async with session.get(url, headers=self.headers, timeout=30) as response:
-                    if response.status == 200:
-                        return await response.text()
-                    else:
+        html, _ = await self.fetch(session, url)
+        return html
+    
+    async def fetch(self, session, url):
+        """(html, unchanged): unchanged is True when the server answered 304 and the cached copy was used"""
+        headers = self.headers
+        if self.http_cache:
+            headers = {**self.headers, **await self.http_cache.avalidators(url)}
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire()
+                async with self.semaphore:  # Limit concurrent requests
+                    sent_at = time.monotonic()
+                    async with session.get(url, headers=headers, timeout=30) as response:
+                        if response.status == 304 and self.http_cache:
+                            body = await self.http_cache.aload(url)
+                            if body is not None:
+                                if self.rate_limiter:
+                                    self.rate_limiter.recover()
+                                return body, True
+                            # Cached body was lost; fetch it again unconditionally
+                            headers = self.headers
+                            continue
+                        if response.status == 200:
+                            if self.rate_limiter:
+                                self.rate_limiter.recover()
+                            html = await response.text()
+                            if self.http_cache:
+                                await self.http_cache.astore(url, html, response.headers)
+                            return html, False
+                        if response.status == 429 or response.status >= 500:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            print(f"Throttled on {url}: Status {response.status} (attempt {attempt + 1})")
+                            if self.rate_limiter:
+                                self.rate_limiter.backoff(retry_after, sent_at)
+                            else:
+                                await asyncio.sleep(retry_after if retry_after is not None else 2 ** attempt)
+                            continue
                         print(f"Error fetching {url}: Status {response.status}")
-                        return None
-        except Exception as e:
-            print(f"Error fetching {url}: {e}")
-            return None
+                        return None, False
+            except Exception as e:
+                print(f"Error fetching {url}: {e}")
+                return None, False
+        print(f"Giving up on {url} after {self.max_retries + 1} attempts")
+        return None, False
     
     def extract_article_links(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        article_links = []
-        for section in soup.find_all('div', class_='flex list_four_new mini-post'):
-            for link in section.find_all('a', href=True):
-                url = urljoin(self.base_url, link['href'])
-                if "/bai-viet/" in url and url not in article_links:
-                    article_links.append(url)
-        return article_links
+        return parse_article_links(html, self.base_url, self.parser)
     
     def extract_article_content(self, html, url):
-        soup = BeautifulSoup(html, 'html.parser')
-        title_element = soup.find('h1', class_='single-title single-title-line')
-        if not title_element:
-            return None
-        
-        title = title_element.text.strip()
-        content_element = soup.find('div', id='main-article', class_='entry')
-        if not content_element:
-            return None
-            
-        # Remove unwanted elements
-        for tag in content_element.find_all(['script', 'style', 'iframe', 'section']):
-            tag.decompose()
-        
-        # Extract text from paragraphs and headings
-        text = ""
-        for tag in content_element.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li']):
-            text += "\n" + tag.get_text(strip=True)
-        
-        # Clean up text
-        text = text.strip()
-        text = re.sub(r'\n+', '\n', text)
-        
-        # Remove booking text
-        text = re.sub(r'Để đặt lịch khám tại viện,.*?ứng dụng\.', '', text)
-        
-        # Include the tag in the article dictionary
-        return {'url': url, 'title': title, 'content': text, 'tag': self.tag}
+        return parse_article_content(html, url, self.tag, self.parser)
+    
+    async def parse(self, func, *args):
+        """Run a parse function in the process pool so the event loop keeps downloading"""
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
     
     async def scrape_article(self, session, link):
-        html = await self.get_page(session, link)
+        html, unchanged = await self.fetch(session, link)
         if html:
-            article = self.extract_article_content(html, link)
+            article = await self.parse(parse_article_content, html, link, self.tag, self.parser)
             if article:
+                if self.http_cache:
+                    # Lets incremental indexing skip articles the server reported as not modified
+                    article['unchanged'] = unchanged
                 print(f"Scraped: {article['title']} [Tag: {article['tag']}]")
                 return article
         return None
@@ -156,7 +369,185 @@ class VinmecScraper:
         
         return self.articles
 
-async def main():
+class CrawlCheckpoint:
+    """
+    Sidecar of a JSONL crawl. Per category it records the first listing page
+    that still has articles not yet written, plus which categories are
+    finished. Articles go to `output_file`.partial, and URLs already written
+    are read back from it. complete() moves the finished crawl into
+    `output_file` and drops the checkpoint, so the next run crawls afresh while
+    readers of `output_file` never see a half-written crawl.
+    """
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.partial_file = output_file + ".partial"
+        self.path = output_file + ".checkpoint.json"
+        self.pages = {}
+        self.finished = set()
+        self.seen = set()
+        self._pending = {}  # tag -> {page: links not yet fetched}
+        self._next_page = {}
+        self._listing_done = set()
+    
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.pages = state.get("pages", {})
+            self.finished = set(state.get("finished", []))
+        if os.path.exists(self.partial_file):
+            with open(self.partial_file, 'rb+') as f:
+                data = f.read()
+                # Drop a line cut short by a crash so appends start on a clean line
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+            with open(self.partial_file, encoding='utf-8') as f:
+                for line in f:
+                    self.seen.add(json.loads(line)['url'])
+        return self
+    
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pages": self.pages, "finished": sorted(self.finished)}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    def complete(self):
+        """Publish the finished crawl as `output_file` and forget the checkpoint"""
+        published = os.path.exists(self.partial_file)
+        if published:
+            os.replace(self.partial_file, self.output_file)
+        self.reset()
+        return published
+    
+    def reset(self):
+        """Discard an unfinished crawl so the next one starts from page 0"""
+        for path in (self.path, self.partial_file):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def start_page(self, tag):
+        return self.pages.get(tag, 0)
+    
+    def page_listed(self, tag, page, links):
+        if links:
+            self._pending.setdefault(tag, {})[page] = links
+        self._next_page[tag] = page + 1
+        self._update(tag)
+    
+    def listing_done(self, tag):
+        self._listing_done.add(tag)
+        self._update(tag)
+    
+    def article_done(self, tag, page):
+        pending = self._pending[tag]
+        pending[page] -= 1
+        if not pending[page]:
+            del pending[page]
+        self._update(tag)
+    
+    def _update(self, tag):
+        pending = self._pending.get(tag)
+        self.pages[tag] = min(pending) if pending else self._next_page.get(tag, self.start_page(tag))
+        if tag in self._listing_done and not pending:
+            self.finished.add(tag)
+        self.save()
+
+async def discover_links(scraper, session, link_queue, checkpoint):
+    """Walk one category's listing pages and queue its article links as they are found"""
+    page_num = checkpoint.start_page(scraper.tag)
+    while True:
+        page_url = scraper.base_url.replace('page_0', f'page_{page_num}')
+        html = await scraper.get_page(session, page_url)
+        if not html:
+            print(f"[{scraper.tag}] Could not fetch page {page_num}. Stopping.")
+            break
+        links = await scraper.parse(parse_article_links, html, scraper.base_url, scraper.parser)
+        if not links:
+            print(f"[{scraper.tag}] No articles found on page {page_num}. Stopping.")
+            break
+        new_links = [link for link in links if link not in checkpoint.seen]
+        print(f"[{scraper.tag}] Page {page_num}: queued {len(new_links)} of {len(links)} articles")
+        checkpoint.page_listed(scraper.tag, page_num, len(new_links))
+        for link in new_links:
+            await link_queue.put((scraper, link, page_num))
+        page_num += 1
+    checkpoint.listing_done(scraper.tag)
+
+async def fetch_articles(session, link_queue, output, checkpoint):
+    """Worker: fetch queued article links and append them to the JSONL output until it receives None"""
+    while True:
+        item = await link_queue.get()
+        if item is None:
+            return
+        scraper, link, page_num = item
+        try:
+            # Another category may have written the same article meanwhile
+            if link not in checkpoint.seen:
+                article = await scraper.scrape_article(session, link)
+                if article:
+                    output.write(json.dumps(article, ensure_ascii=False) + "\n")
+                    output.flush()
+                    checkpoint.seen.add(link)
+        except Exception as e:
+            print(f"Error parsing {link}: {e}")
+        finally:
+            checkpoint.article_done(scraper.tag, page_num)
+
+@timing_decorator
+async def crawl_all(base_urls, tags, concurrency=20, rate=5.0, output_file="all_articles.jsonl",
+                    parser=DEFAULT_PARSER, parse_workers=None, cache_dir=None, fresh=False):
+    """
+    Crawl every category at once over one pooled session. Listing pages feed a
+    bounded queue of article links consumed by `concurrency` workers, and all
+    requests share one adaptive rate limiter. Articles are appended to
+    `output_file`.partial as JSONL as soon as they are parsed, and replace
+    `output_file` once every category is finished. A restarted crawl resumes
+    from the sidecar checkpoint unless `fresh` is set. HTML is parsed in a pool of
+    `parse_workers` processes (0 parses on the event loop). With `cache_dir`,
+    pages are revalidated with conditional GETs against an on-disk HTTP cache.
+    Returns the number of articles written.
+    """
+    checkpoint = CrawlCheckpoint(output_file)
+    if fresh:
+        checkpoint.reset()
+    checkpoint.load()
+    already_written = len(checkpoint.seen)
+    if already_written:
+        print(f"Resuming: {already_written} articles already in {checkpoint.partial_file}, "
+              f"{len(checkpoint.finished)} categories finished")
+    rate_limiter = AdaptiveRateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    link_queue = asyncio.Queue(maxsize=concurrency * 4)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    http_cache = HttpCache(cache_dir) if cache_dir else None
+    executor = ProcessPoolExecutor(max_workers=parse_workers or os.cpu_count()) if parse_workers != 0 else None
+    with open(checkpoint.partial_file, 'a', encoding='utf-8') as output:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            scrapers = [
+                VinmecScraper(url, tag, output_file, rate_limiter=rate_limiter, semaphore=semaphore,
+                              parser=parser, executor=executor, http_cache=http_cache)
+                for url, tag in zip(base_urls, tags) if tag not in checkpoint.finished
+            ]
+            workers = [asyncio.create_task(fetch_articles(session, link_queue, output, checkpoint))
+                       for _ in range(concurrency)]
+            try:
+                await asyncio.gather(*(discover_links(scraper, session, link_queue, checkpoint) for scraper in scrapers))
+                for _ in workers:
+                    await link_queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+    if http_cache:
+        print(http_cache.summary())
+    if set(tags) <= checkpoint.finished and checkpoint.complete():
+        print(f"Crawl complete: {len(checkpoint.seen)} articles in {output_file}")
+    return len(checkpoint.seen) - already_written
+
+async def main(args):
     # Define the URLs and their corresponding tags as separate lists to ensure correct matching
     base_urls = [
         "https://www.vinmec.com/vie/chan-thuong-chinh-hinh-y-hoc-the-thao/page_0",
@@ -206,10 +597,20 @@ async def main():
         "Miễn dịch dị ứng"
     ]
     
-    output_path = r"C:\Users\Admin\Documents\vinmec\scraped_articles\all_articles.json"
+    output_path = args.output
     
     start_time = time.time()
     
+    if not args.sequential:
+        # Articles are streamed to JSONL; the crawl resumes from its checkpoint
+        written = await crawl_all(base_urls, tags, args.concurrency, args.rate, output_path,
+                                  args.parser, args.parse_workers,
+                                  None if args.no_http_cache else args.http_cache, args.fresh)
+        total_time = time.time() - start_time
+        print(f"Wrote {written} new articles to {output_path}")
+        print(f"Total execution time: {total_time:.2f} seconds ({str(timedelta(seconds=int(total_time)))})")
+        return
+    
     # Collect all articles from all URLs
     all_articles = []
     
@@ -230,5 +631,25 @@ async def main():
     print(f"Total execution time: {total_time:.2f} seconds ({str(timedelta(seconds=int(total_time)))})")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl Vinmec health articles")
+    parser.add_argument("--output", type=str, default=r"C:\Users\Admin\Documents\vinmec\scraped_articles\all_articles.jsonl",
+                        help="Output file: JSONL, or a JSON array with --sequential")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight across all categories")
+    parser.add_argument("--rate", type=float, default=5.0, help="Maximum requests per second across all categories")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Crawl one category at a time and write one JSON array at the end (previous behaviour)")
+    parser.add_argument("--parser", type=str, default=DEFAULT_PARSER, choices=["lxml", "html.parser"],
+                        help="BeautifulSoup parser backend")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processes used to parse HTML (default: CPU count, 0 = parse on the event loop)")
+    parser.add_argument("--http-cache", type=str, default=None,
+                        help="Directory of the conditional-GET cache (default: .http_cache next to the output)")
+    parser.add_argument("--no-http-cache", action="store_true", help="Always download pages in full")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Discard an unfinished crawl's checkpoint instead of resuming it")
+    args = parser.parse_args()
+    if args.http_cache is None:
+        args.http_cache = os.path.join(os.path.dirname(args.output) or '.', '.http_cache')
+    
     # Run the async main function
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(args))
\ No newline at end of file
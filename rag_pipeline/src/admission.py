@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .utils import (logger, ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH,
+                    ADMISSION_WAIT_TIME, REJECTED_REQUESTS)
+
+# Generations running at once in this worker
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+# Requests allowed to wait for a slot, and how long they may wait
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Retry-After hints (seconds) sent with 503 and 429 responses
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+SESSION_BUSY_RETRY_AFTER = int(os.getenv("SESSION_BUSY_RETRY_AFTER", "1"))
+
+
+class AdmissionController:
+    """
+    Bounds the work accepted by /chat: a global in-flight limit, at most one
+    active generation per session and a bounded FIFO wait queue with a
+    deadline. Everything else is rejected fast with Retry-After.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters = deque()
+        self._active_sessions = set()
+
+    def _update_metrics(self):
+        ADMISSION_IN_FLIGHT.set(self._in_flight)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _reject(self, status_code, reason, detail, retry_after):
+        REJECTED_REQUESTS.labels(reason=reason).inc()
+        logger.warning(f"Rejecting chat request ({reason})")
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(retry_after)})
+
+    async def acquire(self, session_id: str):
+        """Wait for a generation slot or raise HTTPException 429/503"""
+        if session_id in self._active_sessions:
+            self._reject(429, "session_busy", "A response is already being generated for this session",
+                         SESSION_BUSY_RETRY_AFTER)
+
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._active_sessions.add(session_id)
+            self._update_metrics()
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(503, "queue_full", "Server is busy, please retry later", ADMISSION_RETRY_AFTER)
+
+        # Reserve the session while queued so duplicate submits are rejected too
+        self._active_sessions.add(session_id)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_metrics()
+        start_time = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                self._forget_waiter(waiter, session_id)
+                self._reject(503, "queue_timeout", "Server is busy, please retry later", ADMISSION_RETRY_AFTER)
+        except asyncio.CancelledError:
+            # Client went away while queued; hand back a slot we may have been given
+            if waiter.done() and not waiter.cancelled():
+                self.release(session_id)
+            else:
+                self._forget_waiter(waiter, session_id)
+            raise
+        finally:
+            ADMISSION_WAIT_TIME.observe(time.monotonic() - start_time)
+
+    def _forget_waiter(self, waiter, session_id):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._active_sessions.discard(session_id)
+        self._update_metrics()
+
+    def release(self, session_id: str):
+        """Free the slot held by `session_id` and pass it to the oldest waiter"""
+        self._active_sessions.discard(session_id)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot is transferred, so the in-flight count is unchanged
+                waiter.set_result(None)
+                self._update_metrics()
+                return
+        self._in_flight -= 1
+        self._update_metrics()
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once the response is over, however
+    it ends. Starlette never starts the body iterator (so its finally never
+    runs) when the client disconnects first; an admission slot released there
+    would leak.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .local_index import local_index
+from .utils import (logger, resources, COLLECTION, CORPUS_VERSION_KEY, VECTOR_BACKEND,
+                    ANSWER_CACHE_HITS, ANSWER_CACHE_MISSES, ANSWER_CACHE_SIZE)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# How often the Qdrant collection is polled when CORPUS_VERSION is not pinned
+CORPUS_VERSION_CHECK_INTERVAL = float(os.getenv("CORPUS_VERSION_CHECK_INTERVAL", "60"))
+
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL cache of finished answers keyed by the question embedding and
+    retrieval profile. A lookup hits when the cosine similarity with a stored
+    question of the same profile is at least `threshold`. Entries are dropped
+    when the corpus version changes.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 max_bytes=ANSWER_CACHE_MAX_BYTES, ttl=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        self._corpus_version = None
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_profiles = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _sync_version(self, corpus_version):
+        if corpus_version != self._corpus_version:
+            if self._entries:
+                logger.info(f"Corpus version changed ({self._corpus_version} -> {corpus_version}), clearing answer cache")
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+            self._corpus_version = corpus_version
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        self._matrix = None
+
+    def _purge_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry['created_at'] > self.ttl]
+        for key in expired:
+            self._remove(key)
+
+    def lookup(self, vector, corpus_version=None, profile=None):
+        """Return {'answer', 'sources', 'similarity'} for a close enough question, else None"""
+        with self._lock:
+            self._sync_version(corpus_version)
+            self._purge_expired(time.time())
+            ANSWER_CACHE_SIZE.set(self._bytes)
+            if not self._entries:
+                ANSWER_CACHE_MISSES.inc()
+                return None
+
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[key]['vector'] for key in self._matrix_keys])
+                self._matrix_profiles = np.array([self._entries[key]['profile'] for key in self._matrix_keys], dtype=object)
+
+            similarities = self._matrix @ self._normalize(vector)
+            # Answers built from another profile's retrieval never match
+            similarities = np.where(self._matrix_profiles == profile, similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                ANSWER_CACHE_MISSES.inc()
+                return None
+
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            ANSWER_CACHE_HITS.inc()
+            return {'answer': entry['answer'], 'sources': entry['sources'], 'similarity': similarity}
+
+    def store(self, vector, answer, sources, corpus_version=None, profile=None):
+        if not answer:
+            return
+        vec = self._normalize(vector)
+        size = vec.nbytes + len(answer.encode('utf-8')) + len(json.dumps(sources).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._sync_version(corpus_version)
+            self._entries[self._next_key] = {
+                'vector': vec,
+                'answer': answer,
+                'sources': sources,
+                'profile': profile,
+                'created_at': time.time(),
+                'size': size,
+            }
+            self._next_key += 1
+            self._bytes += size
+            self._matrix = None
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+            ANSWER_CACHE_SIZE.set(self._bytes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+            ANSWER_CACHE_SIZE.set(0)
+
+
+_corpus_version = {'value': None, 'checked_at': 0.0}
+
+
+async def get_corpus_version():
+    """
+    Corpus version used to invalidate cached answers. CORPUS_VERSION pins it
+    explicitly. With the local backend it is the loaded snapshot version, so a
+    snapshot swap invalidates the cache without polling Qdrant. Otherwise the
+    version ingest records in the collection metadata is used; collections
+    ingested before that fall back to the point count, which misses in-place
+    updates.
+    """
+    pinned = os.getenv("CORPUS_VERSION")
+    if pinned:
+        return pinned
+    if VECTOR_BACKEND == "local":
+        return f"snapshot:{local_index.version}"
+
+    now = time.time()
+    if now - _corpus_version['checked_at'] >= CORPUS_VERSION_CHECK_INTERVAL:
+        _corpus_version['checked_at'] = now
+        try:
+            info = await resources.aclient.get_collection(COLLECTION)
+            version = (info.config.metadata or {}).get(CORPUS_VERSION_KEY)
+            _corpus_version['value'] = f"ingest:{version}" if version else f"points:{info.points_count}"
+        except Exception as e:
+            logger.warning(f"Could not read corpus version from Qdrant: {e}")
+    return _corpus_version['value']
+
+
+answer_cache = SemanticAnswerCache()
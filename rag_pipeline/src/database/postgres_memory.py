@@ -1,9 +1,20 @@
 import uuid
-import psycopg
+import hashlib
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool, AsyncConnectionPool, PoolTimeout
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import messages_from_dict
 from langchain_postgres import PostgresChatMessageHistory
 import logging
 import os
+from ..utils import (ERROR_COUNT, DB_POOL_WAIT_TIME, DB_POOL_SIZE, DB_POOL_IN_USE, DB_POOL_WAITING,
+                     HISTORY_LOAD_TIME, trace_exemplar)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -11,49 +22,273 @@ logger = logging.getLogger(__name__)
 # Database connection settings - use environment variables
 DB_CONFIG = {
     "dbname": os.getenv("POSTGRES_DB", "medical_chatbot"),
-    "user": os.getenv("POSTGRES_USER", "admin"), 
+    "user": os.getenv("POSTGRES_USER", "admin"),
     "password": os.getenv("POSTGRES_PASSWORD", "admin123"),
     "host": os.getenv("POSTGRES_HOST", "localhost"),
     "port": os.getenv("POSTGRES_PORT", "5432"),
 }
 
+# Connection pool settings (shared by all requests in the worker)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
 table_name = "message_store"
 
+# Only the most recent messages are ever used to build the prompt
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "4"))
+# In-process cache of recent windows. Kept short-lived because another
+# worker may have appended to the same session in the meantime.
+HISTORY_CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "1024"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "60"))
+
+_pool = None
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+
+def _record_pool_stats(pool, kind):
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    DB_POOL_SIZE.labels(pool=kind).set(size)
+    DB_POOL_IN_USE.labels(pool=kind).set(size - stats.get("pool_available", 0))
+    DB_POOL_WAITING.labels(pool=kind).set(stats.get("requests_waiting", 0))
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            make_conninfo(**DB_CONFIG),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            name="chat-history",
+            open=True,
+        )
+        logger.info(f"PostgreSQL pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _pool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Return the async connection pool used from the FastAPI event loop"""
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    make_conninfo(**DB_CONFIG),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    name="chat-history-async",
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+                logger.info(f"PostgreSQL async pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _async_pool
+
+
+@contextmanager
+def acquire_connection():
+    """Borrow a connection from the pool; the transaction is committed on return"""
+    pool = get_pool()
+    start_time = time.monotonic()
+    try:
+        with pool.connection(timeout=DB_POOL_TIMEOUT) as conn:
+            DB_POOL_WAIT_TIME.labels(pool="sync").observe(time.monotonic() - start_time)
+            _record_pool_stats(pool, "sync")
+            yield conn
+    except PoolTimeout:
+        ERROR_COUNT.labels(error_type="db_pool_timeout").inc()
+        logger.error(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a PostgreSQL connection")
+        raise
+    finally:
+        _record_pool_stats(pool, "sync")
+
+
+@asynccontextmanager
+async def aacquire_connection():
+    pool = await get_async_pool()
+    start_time = time.monotonic()
+    try:
+        async with pool.connection(timeout=DB_POOL_TIMEOUT) as conn:
+            DB_POOL_WAIT_TIME.labels(pool="async").observe(time.monotonic() - start_time)
+            _record_pool_stats(pool, "async")
+            yield conn
+    except PoolTimeout:
+        ERROR_COUNT.labels(error_type="db_pool_timeout").inc()
+        logger.error(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a PostgreSQL connection")
+        raise
+    finally:
+        _record_pool_stats(pool, "async")
+
+
+def close_pools():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+async def aclose_pools():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    close_pools()
+
+
 def init_database():
     """Initialize database and create table if not exists"""
     try:
         logger.info("Initializing PostgreSQL database...")
-        connection = psycopg.connect(**DB_CONFIG)
-        
-        # Setup schema - this will create the table if it doesn't exist
-        PostgresChatMessageHistory.create_tables(connection, table_name)
+        with acquire_connection() as connection:
+            # Setup schema - this will create the table if it doesn't exist
+            PostgresChatMessageHistory.create_tables(connection, table_name)
+            # Lets the windowed query read the newest rows of a session straight from the index
+            connection.execute(sql.SQL(
+                "CREATE INDEX IF NOT EXISTS {index} ON {table} (session_id, id DESC)"
+            ).format(
+                index=sql.Identifier(f"idx_{table_name}_session_id_id"),
+                table=sql.Identifier(table_name),
+            ))
         logger.info(f"Database initialized successfully. Table '{table_name}' ready.")
-        connection.close()
-        
+
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
 
-def get_by_session_id(session_id: str) -> BaseChatMessageHistory:
-    """Get chat history by session ID"""
-    logger.info(f"PostgreSQL: Getting chat history for session_id: {session_id}")
-    sync_connection = psycopg.connect(**DB_CONFIG)
-    
-    # Convert session_id to valid UUID if it's not already
+
+def to_session_uuid(session_id: str) -> uuid.UUID:
+    """Convert session_id to valid UUID if it's not already"""
     try:
         # Try to parse as UUID first
-        session_uuid = uuid.UUID(session_id)
+        return uuid.UUID(session_id)
     except ValueError:
         # If not valid UUID, create UUID from string hash
-        import hashlib
-        hash_object = hashlib.md5(session_id.encode())
-        hash_hex = hash_object.hexdigest()
-        # Format as UUID string
-        session_uuid = uuid.UUID(hash_hex)
+        session_uuid = uuid.UUID(hashlib.md5(session_id.encode()).hexdigest())
         logger.info(f"Converted session_id '{session_id}' to UUID: {session_uuid}")
-    
-    return PostgresChatMessageHistory(
-        table_name, 
-        str(session_uuid), 
-        sync_connection=sync_connection
-    ) 
\ No newline at end of file
+        return session_uuid
+
+
+class HistoryWindowCache:
+    """LRU cache of the last HISTORY_WINDOW messages per session UUID"""
+
+    def __init__(self, max_sessions=HISTORY_CACHE_MAX_SESSIONS, ttl=HISTORY_CACHE_TTL, window=HISTORY_WINDOW):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.window = window
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            cached = self._windows.get(session_id)
+            if cached is None:
+                return None
+            messages, cached_at = cached
+            if time.monotonic() - cached_at > self.ttl:
+                del self._windows[session_id]
+                return None
+            self._windows.move_to_end(session_id)
+            return list(messages)
+
+    def set(self, session_id, messages):
+        with self._lock:
+            self._windows[session_id] = (list(messages)[-self.window:], time.monotonic())
+            self._windows.move_to_end(session_id)
+            while len(self._windows) > self.max_sessions:
+                self._windows.popitem(last=False)
+
+    def append(self, session_id, messages):
+        """Extend a cached window after a write, without re-reading the session"""
+        with self._lock:
+            cached = self._windows.get(session_id)
+            if cached is None:
+                return
+            window = (cached[0] + list(messages))[-self.window:]
+            self._windows[session_id] = (window, cached[1])
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._windows.pop(session_id, None)
+
+
+history_window_cache = HistoryWindowCache()
+
+_window_query = sql.SQL(
+    "SELECT message FROM ("
+    "SELECT id, message FROM {table} WHERE session_id = %s ORDER BY id DESC LIMIT %s"
+    ") AS recent ORDER BY id"
+).format(table=sql.Identifier(table_name))
+
+
+class PooledPostgresChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history that borrows a pooled connection for each operation and
+    only loads the last `window` messages of the session.
+    """
+
+    def __init__(self, session_id: str, window: int = HISTORY_WINDOW):
+        self.session_id = str(to_session_uuid(session_id))
+        self.window = window
+
+    @property
+    def messages(self):
+        start_time = time.perf_counter()
+        cached = history_window_cache.get(self.session_id)
+        if cached is not None:
+            HISTORY_LOAD_TIME.labels(source="cache").observe(time.perf_counter() - start_time)
+            return cached
+        with acquire_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_window_query, (self.session_id, self.window))
+                records = cursor.fetchall()
+        messages = messages_from_dict([record[0] for record in records])
+        history_window_cache.set(self.session_id, messages)
+        HISTORY_LOAD_TIME.labels(source="db").observe(time.perf_counter() - start_time, exemplar=trace_exemplar())
+        return messages
+
+    def add_messages(self, messages) -> None:
+        with acquire_connection() as conn:
+            PostgresChatMessageHistory(table_name, self.session_id, sync_connection=conn).add_messages(messages)
+        history_window_cache.append(self.session_id, messages)
+
+    def clear(self) -> None:
+        with acquire_connection() as conn:
+            PostgresChatMessageHistory(table_name, self.session_id, sync_connection=conn).clear()
+        history_window_cache.invalidate(self.session_id)
+
+    async def aget_messages(self):
+        start_time = time.perf_counter()
+        cached = history_window_cache.get(self.session_id)
+        if cached is not None:
+            HISTORY_LOAD_TIME.labels(source="cache").observe(time.perf_counter() - start_time)
+            return cached
+        async with aacquire_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(_window_query, (self.session_id, self.window))
+                records = await cursor.fetchall()
+        messages = messages_from_dict([record[0] for record in records])
+        history_window_cache.set(self.session_id, messages)
+        HISTORY_LOAD_TIME.labels(source="db").observe(time.perf_counter() - start_time, exemplar=trace_exemplar())
+        return messages
+
+    async def aadd_messages(self, messages) -> None:
+        async with aacquire_connection() as conn:
+            await PostgresChatMessageHistory(table_name, self.session_id, async_connection=conn).aadd_messages(messages)
+        history_window_cache.append(self.session_id, messages)
+
+    async def aclear(self) -> None:
+        async with aacquire_connection() as conn:
+            await PostgresChatMessageHistory(table_name, self.session_id, async_connection=conn).aclear()
+        history_window_cache.invalidate(self.session_id)
+
+
+def get_by_session_id(session_id: str) -> BaseChatMessageHistory:
+    """Get chat history by session ID"""
+    logger.info(f"PostgreSQL: Getting chat history for session_id: {session_id}")
+    return PooledPostgresChatMessageHistory(session_id)
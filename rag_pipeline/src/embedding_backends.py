@@ -0,0 +1,151 @@
+"""
+Embedding backends for the question encoder.
+
+EMBEDDING_BACKEND selects how resources.embedder is loaded:
+- "torch": full-precision PyTorch SentenceTransformer from EMBEDDINGS_MODEL (default)
+- "onnx-int8": ONNX Runtime with dynamic int8 quantization, exported once to ONNX_MODEL_DIR
+
+Export and parity check from the repository root:
+    python -m rag_pipeline.src.embedding_backends --export
+    python -m rag_pipeline.src.embedding_backends --parity
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from .utils import (logger, EMBEDDINGS_MODEL, ONNX_MODEL_DIR, EMBEDDING_BACKEND,
+                    EMBEDDING_THREADS, EMBEDDING_QUANTIZATION, download_model_if_needed)
+
+BACKENDS = ("torch", "onnx-int8")
+
+# Representative questions used when no parity sample file is given
+PARITY_SENTENCES = [
+    "Triệu chứng sốt xuất huyết?",
+    "Trẻ 6 tháng tuổi cần tiêm những loại vắc xin nào?",
+    "Đau dạ dày nên ăn gì và kiêng gì?",
+    "Cách phòng ngừa bệnh tay chân miệng ở trẻ nhỏ",
+    "Tăng huyết áp có nguy hiểm không?",
+    "Uống paracetamol quá liều có sao không?",
+    "Dấu hiệu nhận biết ung thư vú giai đoạn đầu",
+    "Mất ngủ kéo dài phải làm sao?",
+]
+
+
+def quantized_file_name(quantization=EMBEDDING_QUANTIZATION) -> str:
+    """File name sentence-transformers gives the quantized export, e.g. model_qint8_avx512_vnni.onnx"""
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    config = getattr(AutoQuantizationConfig, quantization)(is_static=False)
+    return f"model_{config.weights_dtype.name.lower()}_{quantization}.onnx"
+
+
+def export_onnx_int8(model_dir=EMBEDDINGS_MODEL, onnx_dir=ONNX_MODEL_DIR,
+                     quantization=EMBEDDING_QUANTIZATION, force=False) -> Path:
+    """Export the cached model to ONNX and write a dynamically int8-quantized copy"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    onnx_dir = Path(onnx_dir)
+    target = onnx_dir / "onnx" / quantized_file_name(quantization)
+    if target.exists() and not force:
+        return target
+
+    logger.info(f"Exporting {model_dir} to ONNX ({quantization} int8) in {onnx_dir}...")
+    start_time = time.time()
+    # Loading a PyTorch checkpoint with backend="onnx" runs the FP32 ONNX export
+    onnx_model = SentenceTransformer(str(model_dir), backend="onnx", device="cpu")
+    onnx_model.save(str(onnx_dir))
+    export_dynamic_quantized_onnx_model(onnx_model, quantization, str(onnx_dir))
+    logger.info(f"ONNX int8 export written to {target} in {time.time() - start_time:.1f}s")
+    return target
+
+
+def _session_options(threads):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def load_embedder(backend=EMBEDDING_BACKEND, model_dir=EMBEDDINGS_MODEL, onnx_dir=ONNX_MODEL_DIR,
+                  threads=EMBEDDING_THREADS, quantization=EMBEDDING_QUANTIZATION):
+    """Load the question encoder for the selected backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {BACKENDS}")
+
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(str(model_dir), device="cpu")
+
+    export_onnx_int8(model_dir, onnx_dir, quantization)
+    logger.info(f"Loading ONNX int8 embedder from {onnx_dir} (threads={threads or 'auto'})")
+    return SentenceTransformer(
+        str(onnx_dir),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": quantized_file_name(quantization),
+            "provider": "CPUExecutionProvider",
+            "session_options": _session_options(threads),
+        },
+    )
+
+
+def _timed_encode(model, sentences, repeats):
+    model.encode(sentences[:1], show_progress_bar=False)  # warm-up
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for sentence in sentences:
+            model.encode(sentence, show_progress_bar=False)
+    per_query = (time.perf_counter() - start_time) / (repeats * len(sentences))
+    return model.encode(sentences, normalize_embeddings=True, show_progress_bar=False), per_query
+
+
+def check_parity(sentences=None, backend="onnx-int8", repeats=3, model_dir=EMBEDDINGS_MODEL,
+                 onnx_dir=ONNX_MODEL_DIR, threads=EMBEDDING_THREADS, quantization=EMBEDDING_QUANTIZATION) -> dict:
+    """Compare `backend` against the FP32 PyTorch model: cosine drift and single-query latency"""
+    sentences = sentences or PARITY_SENTENCES
+    reference = load_embedder("torch", model_dir, onnx_dir, threads, quantization)
+    candidate = load_embedder(backend, model_dir, onnx_dir, threads, quantization)
+
+    ref_vectors, ref_latency = _timed_encode(reference, sentences, repeats)
+    cand_vectors, cand_latency = _timed_encode(candidate, sentences, repeats)
+    cosine = np.sum(ref_vectors * cand_vectors, axis=1)
+
+    return {
+        "backend": backend,
+        "sentences": len(sentences),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "drift_max": float(1.0 - cosine.min()),
+        "fp32_latency_ms": ref_latency * 1000,
+        "backend_latency_ms": cand_latency * 1000,
+        "speedup": ref_latency / cand_latency if cand_latency else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate embedding backends")
+    parser.add_argument("--export", action="store_true", help="Export the ONNX int8 model")
+    parser.add_argument("--force", action="store_true", help="Re-export even if the artifact exists")
+    parser.add_argument("--parity", action="store_true", help="Report cosine drift against the FP32 model")
+    parser.add_argument("--sentences", type=str, help="Text file with one sample question per line")
+    args = parser.parse_args()
+
+    download_model_if_needed()
+    if args.export:
+        export_onnx_int8(force=args.force)
+    if args.parity:
+        samples = None
+        if args.sentences:
+            samples = [line.strip() for line in Path(args.sentences).read_text(encoding="utf-8").splitlines() if line.strip()]
+        print(json.dumps(check_parity(samples), indent=2))
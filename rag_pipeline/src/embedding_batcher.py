@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .utils import (logger, resources, ERROR_COUNT,
+                    EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_WAIT)
+
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+
+class BatchingEmbedder:
+    """
+    Gathers concurrent encode calls into one batched forward pass.
+    A batch is flushed when it reaches `max_batch_size` or `max_wait` seconds
+    after its first request arrived. Encoding runs on a dedicated worker
+    thread; callers receive a concurrent.futures.Future.
+    """
+
+    def __init__(self, model=None, max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+                 max_wait=EMBEDDING_MAX_WAIT_MS / 1000):
+        # Defaults to resources.embedder, resolved on the first batch
+        self._model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = resources.embedder
+        return self._model
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, text: str):
+        """Blocking helper with the same call shape as SentenceTransformer.encode(str)"""
+        return self.submit(text).result()
+
+    def close(self):
+        self._queue.put(None)
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the shutdown marker back so the loop sees it after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [item for item in self._collect_batch(first) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            for _, _, enqueued in batch:
+                EMBEDDING_QUEUE_WAIT.observe(started - enqueued)
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+
+            try:
+                vectors = self.model.encode([text for text, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                logger.error(f"Batched embedding failed for {len(batch)} inputs: {e}")
+                ERROR_COUNT.labels(error_type="embedding_batch").inc()
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+embedding_batcher = BatchingEmbedder()
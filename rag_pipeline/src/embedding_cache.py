@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .utils import (logger, CACHE_DIR, EMBEDDINGS_MODEL, EMBEDDING_BACKEND, EMBEDDING_QUANTIZATION,
+                    EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES,
+                    EMBEDDING_CACHE_HIT_RATIO, EMBEDDING_CACHE_SIZE)
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+# Leave empty to keep the cache in memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_DIR / "query_embeddings.npz"))
+
+# Vectors differ per backend and, for int8, per quantization target
+EMBEDDING_MODEL_ID = f"{EMBEDDINGS_MODEL}:{EMBEDDING_BACKEND}" + (
+    f":{EMBEDDING_QUANTIZATION}" if EMBEDDING_BACKEND == "onnx-int8" else "")
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """NFC-normalize, collapse whitespace and casefold so equivalent Vietnamese queries share a key"""
+    text = unicodedata.normalize("NFC", text)
+    text = _whitespace.sub(" ", text).strip()
+    return text.casefold()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of question vectors, optionally persisted to a .npz file"""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, path=EMBEDDING_CACHE_PATH,
+                 model_id=EMBEDDING_MODEL_ID):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.model_id = model_id
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def _update_metrics(self):
+        total = self._hits + self._misses
+        EMBEDDING_CACHE_HIT_RATIO.set(self._hits / total if total else 0.0)
+        EMBEDDING_CACHE_SIZE.set(self._bytes)
+
+    def get(self, text: str):
+        key = normalize_query(text)
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self._misses += 1
+                EMBEDDING_CACHE_MISSES.inc()
+            else:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                EMBEDDING_CACHE_HITS.inc()
+            self._update_metrics()
+            return vec
+
+    def put(self, text: str, vector):
+        key = normalize_query(text)
+        vec = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes + len(key.encode('utf-8'))
+            self._entries[key] = vec
+            self._bytes += vec.nbytes + len(key.encode('utf-8'))
+            while len(self._entries) > self.max_entries:
+                old_key, old_vec = self._entries.popitem(last=False)
+                self._bytes -= old_vec.nbytes + len(old_key.encode('utf-8'))
+            self._update_metrics()
+
+    def get_or_compute(self, text: str, encode):
+        """Return the cached vector for `text`, calling `encode(text)` on a miss"""
+        vec = self.get(text)
+        if vec is None:
+            vec = np.asarray(encode(text), dtype=np.float32)
+            self.put(text, vec)
+        return vec
+
+    async def aget_or_compute(self, text: str, aencode):
+        """Async variant of get_or_compute; `aencode(text)` must return an awaitable"""
+        vec = self.get(text)
+        if vec is None:
+            vec = np.asarray(await aencode(text), dtype=np.float32)
+            self.put(text, vec)
+        return vec
+
+    def save(self):
+        """Write the cache to disk (atomically) so the next start is warm"""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._entries:
+                return
+            keys = np.array(list(self._entries.keys()))
+            vectors = np.stack(list(self._entries.values()))
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, keys=keys, vectors=vectors, model_id=np.array(self.model_id))
+            os.replace(tmp_path, self.path)
+            logger.info(f"Saved {len(keys)} query embeddings to {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to save query embedding cache: {e}")
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_id"]) != self.model_id:
+                    logger.info("Query embedding cache was built with another model, ignoring it")
+                    return
+                keys, vectors = data["keys"], data["vectors"]
+            # Oldest entries first so the most recent ones survive the size cap
+            for key, vec in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+                self.put(str(key), vec)
+            logger.info(f"Loaded {len(self._entries)} query embeddings from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load query embedding cache: {e}")
+
+
+query_embedding_cache = QueryEmbeddingCache()
+query_embedding_cache.load()
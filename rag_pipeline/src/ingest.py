@@ -0,0 +1,442 @@
+"""
+Ingest crawled articles into the medical_data collection.
+
+Articles are streamed from the crawler's all_articles.json (a JSON array) or
+from a .jsonl file. Each article is split into chunks that carry its title,
+url and tag as metadata. Chunks are embedded in large batches, then
+upserted by a pool of parallel workers with retries. Progress is saved to a
+checkpoint after every batch, so an interrupted run picks up where it
+stopped; the checkpoint is removed once a run completes. Point ids are
+derived from url and chunk index, which makes re-ingesting an article
+idempotent.
+
+A manifest of per-article and per-chunk content hashes is kept next to the
+checkpoint. With --incremental, unchanged articles and chunks are skipped,
+only new or changed chunks are embedded, and points of articles missing from
+the input are deleted.
+
+Every run records the manifest hash as the collection's corpus version
+(collection metadata), which invalidates the serving answer cache.
+
+Run from the repository root:
+    python -m rag_pipeline.src.ingest data/all_articles.json
+    python -m rag_pipeline.src.ingest data/all_articles.json --incremental
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client.http import models
+
+from .utils import logger, resources, COLLECTION, CACHE_DIR, CORPUS_VERSION_KEY
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "100"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "64"))
+INGEST_UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+INGEST_DELETE_BATCH = int(os.getenv("INGEST_DELETE_BATCH", "1000"))
+INGEST_CHECKPOINT_DIR = CACHE_DIR / "ingest"
+
+_READ_SIZE = 1 << 16
+
+
+def iter_articles(path: Path):
+    """Yield articles one at a time from a .jsonl file or a top-level JSON array"""
+    with open(path, encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = f.read(_READ_SIZE).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} is not a JSON array")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                article, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                more = f.read(_READ_SIZE)
+                if not more:
+                    raise
+                buffer += more
+                continue
+            yield article
+            buffer = buffer[end:]
+
+
+def point_id(url: str, chunk_index: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{url}#{chunk_index}"))
+
+
+def chunk_article(article: dict, splitter) -> list:
+    """(point id, payload) pairs in the langchain-qdrant payload layout"""
+    metadata = {key: value for key, value in article.items() if key not in ("content", "unchanged")}
+    chunks = splitter.split_text(article.get("content") or "")
+    return [
+        (point_id(article.get("url", ""), i), {"page_content": chunk, "metadata": {**metadata, "chunk": i}})
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def content_hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    Content hashes of what is stored in the collection, keyed by article url:
+    {"hash": article hash, "chunks": [chunk hash, ...]}. Chunk i of an article
+    is stored under point_id(url, i).
+    """
+
+    def __init__(self, path: Path, collection: str, chunk_size: int, chunk_overlap: int):
+        self.path = path
+        self.collection = collection
+        # Article hashes include the splitter settings, so changing them re-chunks everything
+        self.params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        self.articles = {}
+        self.seen = set()
+        self.stats = Counter()
+
+    def load(self):
+        if self.path.exists():
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+            if state.get("collection") == self.collection:
+                self.articles = state["articles"]
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"collection": self.collection, "articles": self.articles},
+                                       ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def plan(self, article: dict, splitter, incremental: bool):
+        """
+        Chunks of `article` to (re)write, point ids that no longer exist and
+        the article's new manifest entry. None if the article is unchanged.
+        """
+        url = article.get("url", "")
+        self.seen.add(url)
+        old = self.articles.get(url)
+        # The crawler marks articles its HTTP cache revalidated with a 304. That only
+        # says the page matches the crawler's cache, not what was ingested, so the
+        # hash below still decides; the flag is only counted.
+        if article.get("unchanged"):
+            self.stats["articles_not_modified"] += 1
+        article_hash = content_hash([self.params, {k: v for k, v in article.items() if k != "unchanged"}])
+        if incremental and old and old["hash"] == article_hash:
+            self.stats["articles_unchanged"] += 1
+            self.stats["chunks_unchanged"] += len(old["chunks"])
+            return None
+        if article.get("unchanged") and old:
+            logger.info(f"{url} was not modified upstream but differs from the manifest, re-ingesting")
+        self.stats["articles_changed" if old else "articles_new"] += 1
+
+        chunks = chunk_article(article, splitter)
+        chunk_hashes = [content_hash(payload) for _, payload in chunks]
+        old_hashes = old["chunks"] if old else []
+        changed = []
+        for i, (pid, payload) in enumerate(chunks):
+            if incremental and i < len(old_hashes) and old_hashes[i] == chunk_hashes[i]:
+                self.stats["chunks_unchanged"] += 1
+            else:
+                changed.append((pid, payload))
+        stale = [point_id(url, i) for i in range(len(chunks), len(old_hashes))]
+        return changed, stale, {"hash": article_hash, "chunks": chunk_hashes}
+
+    def removed(self) -> dict:
+        """Articles in the manifest that were not in this run's input"""
+        return {url: entry for url, entry in self.articles.items() if url not in self.seen}
+
+
+def iter_batches(articles, splitter, batch_size, manifest: Manifest, skip=0, incremental=False):
+    """
+    Group whole articles into batches of at least `batch_size` chunks to write.
+    Yields (ids, payloads, articles_end, entries, stale) where articles_end is
+    the input position just after the batch's last article, entries the new
+    manifest entries and stale the point ids to delete.
+    """
+    ids, payloads, entries, stale = [], [], {}, []
+    position = flushed = skip
+    for position, article in enumerate(articles, start=1):
+        if position <= skip:
+            continue
+        plan = manifest.plan(article, splitter, incremental)
+        if plan is None:
+            continue
+        changed, article_stale, entry = plan
+        for pid, payload in changed:
+            ids.append(pid)
+            payloads.append(payload)
+        stale.extend(article_stale)
+        entries[article.get("url", "")] = entry
+        if len(ids) >= batch_size:
+            yield ids, payloads, position, entries, stale
+            ids, payloads, entries, stale = [], [], {}, []
+            flushed = position
+    if position > flushed:
+        yield ids, payloads, position, entries, stale
+
+
+class Checkpoint:
+    """
+    Number of leading input articles whose chunks are all in Qdrant. Only
+    valid for the exact input file it was written for: a different size or
+    mtime (e.g. a re-crawl into the same path) starts over from article 0.
+    """
+
+    def __init__(self, path: Path, input_path: Path, collection: str):
+        self.path = path
+        stat = input_path.stat()
+        self.key = {"input": str(input_path.resolve()), "collection": collection,
+                    "input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns}
+        self.articles_done = 0
+        self.vectors_done = 0
+
+    def load(self):
+        if self.path.exists():
+            state = json.loads(self.path.read_text(encoding="utf-8"))
+            if {k: state.get(k) for k in self.key} == self.key:
+                self.articles_done = state["articles_done"]
+                self.vectors_done = state["vectors_done"]
+            else:
+                logger.warning(f"Checkpoint {self.path} was written for a different input, starting from the first article")
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            **self.key, "articles_done": self.articles_done, "vectors_done": self.vectors_done,
+        }), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Forget the checkpoint once a run has completed"""
+        self.path.unlink(missing_ok=True)
+
+
+def upsert_with_retry(client, collection, points, max_retries=INGEST_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            client.upsert(collection_name=collection, points=points, wait=True)
+            return len(points)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Upsert of {len(points)} points failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def delete_with_retry(client, collection, ids, max_retries=INGEST_MAX_RETRIES):
+    for i in range(0, len(ids), INGEST_DELETE_BATCH):
+        batch = ids[i:i + INGEST_DELETE_BATCH]
+        for attempt in range(max_retries + 1):
+            try:
+                client.delete(collection_name=collection, points_selector=models.PointIdsList(points=batch), wait=True)
+                break
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"Delete of {len(batch)} points failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+    return len(ids)
+
+
+def publish_corpus_version(client, collection, manifest: Manifest):
+    """
+    Record the manifest hash in the collection metadata. The serving answer
+    cache keys on it, so in-place updates invalidate cached answers.
+    """
+    version = content_hash(manifest.articles)
+    try:
+        client.update_collection(collection_name=collection, metadata={CORPUS_VERSION_KEY: version})
+        logger.info(f"Corpus version of '{collection}' is now {version}")
+    except Exception as e:
+        logger.error(f"Could not record the corpus version of '{collection}': {e}")
+    return version
+
+
+def ensure_collection(client, collection, dim):
+    if not client.collection_exists(collection):
+        logger.info(f"Creating collection '{collection}' ({dim} dims, cosine)")
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+        )
+
+
+def ingest(input_path, collection=COLLECTION, chunk_size=INGEST_CHUNK_SIZE, chunk_overlap=INGEST_CHUNK_OVERLAP,
+           embed_batch=INGEST_EMBED_BATCH, upsert_batch=INGEST_UPSERT_BATCH, upsert_workers=INGEST_UPSERT_WORKERS,
+           embed_processes=0, checkpoint_path=None, resume=True, incremental=False, manifest_path=None) -> dict:
+    input_path = Path(input_path)
+    checkpoint_path = Path(checkpoint_path or INGEST_CHECKPOINT_DIR / f"{input_path.stem}.{collection}.json")
+    checkpoint = Checkpoint(checkpoint_path, input_path, collection)
+    manifest = Manifest(Path(manifest_path or INGEST_CHECKPOINT_DIR / f"{collection}.manifest.json"),
+                        collection, chunk_size, chunk_overlap).load()
+    # The manifest already makes incremental runs resumable
+    if resume and not incremental:
+        checkpoint.load()
+        if checkpoint.articles_done:
+            logger.info(f"Resuming after {checkpoint.articles_done} articles ({checkpoint.vectors_done} vectors)")
+
+    client = resources.client
+    embedder = resources.embedder
+    # Renamed to get_embedding_dimension in newer sentence-transformers
+    get_dimension = getattr(embedder, "get_embedding_dimension", None) or embedder.get_sentence_embedding_dimension
+    ensure_collection(client, collection, get_dimension())
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    # Optional multi-process encoding; 0 encodes in this process with the model's own threads
+    encode_pool = embedder.start_multi_process_pool(["cpu"] * embed_processes) if embed_processes > 1 else None
+
+    start_time = time.time()
+    start_articles, start_vectors = checkpoint.articles_done, checkpoint.vectors_done
+    # Batches whose upserts are still running:
+    # seq -> [remaining sub-batches, articles_end, vectors, manifest entries, stale point ids]
+    in_flight = {}
+    finished = set()
+    next_seq = 0
+    committed_seq = 0
+
+    def advance_checkpoint():
+        nonlocal committed_seq
+        # Only move past batches that completed in input order
+        while committed_seq in finished:
+            finished.discard(committed_seq)
+            _, articles_end, vectors, entries, stale = in_flight.pop(committed_seq)
+            if stale:
+                manifest.stats["points_deleted"] += delete_with_retry(client, collection, stale)
+            manifest.articles.update(entries)
+            checkpoint.articles_done = articles_end
+            checkpoint.vectors_done += vectors
+            committed_seq += 1
+        checkpoint.save()
+        manifest.save()
+
+    def collect(futures, return_when):
+        done, _ = wait(futures, return_when=return_when)
+        for future in done:
+            seq = futures.pop(future)
+            future.result()  # Re-raise an upsert that ran out of retries
+            in_flight[seq][0] -= 1
+            if in_flight[seq][0] == 0:
+                finished.add(seq)
+        advance_checkpoint()
+        elapsed = time.time() - start_time
+        articles = checkpoint.articles_done - start_articles
+        vectors = checkpoint.vectors_done - start_vectors
+        logger.info(f"{checkpoint.articles_done} articles, {checkpoint.vectors_done} vectors "
+                    f"({articles / elapsed:.1f} articles/s, {vectors / elapsed:.1f} vectors/s)")
+
+    futures = {}
+    try:
+        with ThreadPoolExecutor(max_workers=upsert_workers, thread_name_prefix="qdrant-upsert") as executor:
+            batches = iter_batches(iter_articles(input_path), splitter, embed_batch, manifest,
+                                   skip=checkpoint.articles_done, incremental=incremental)
+            for ids, payloads, articles_end, entries, stale in batches:
+                texts = [payload["page_content"] for payload in payloads]
+                vectors = embedder.encode(texts, batch_size=embed_batch, pool=encode_pool,
+                                          show_progress_bar=False) if texts else []
+                seq = next_seq
+                next_seq += 1
+                sub_batches = [
+                    [models.PointStruct(id=pid, vector=vector.tolist(), payload=payload)
+                     for pid, vector, payload in zip(ids[i:i + upsert_batch], vectors[i:i + upsert_batch],
+                                                     payloads[i:i + upsert_batch])]
+                    for i in range(0, len(ids), upsert_batch)
+                ]
+                in_flight[seq] = [len(sub_batches), articles_end, len(ids), entries, stale]
+                if not sub_batches:
+                    finished.add(seq)
+                for points in sub_batches:
+                    futures[executor.submit(upsert_with_retry, client, collection, points)] = seq
+
+                # Keep encoding ahead of the upserts, but bound the vectors held in memory
+                if len(futures) >= upsert_workers * 2:
+                    collect(futures, FIRST_COMPLETED)
+            while futures:
+                collect(futures, FIRST_COMPLETED)
+            advance_checkpoint()
+        # Completed: the next run must read the whole input again
+        checkpoint.clear()
+    except BaseException:
+        # Batches committed before the failure are already being served
+        publish_corpus_version(client, collection, manifest)
+        raise
+    finally:
+        if encode_pool is not None:
+            embedder.stop_multi_process_pool(encode_pool)
+
+    if incremental:
+        # Every article was read, so anything left in the manifest is gone from the source
+        removed = manifest.removed()
+        stale = [point_id(url, i) for url, entry in removed.items() for i in range(len(entry["chunks"]))]
+        if stale:
+            manifest.stats["points_deleted"] += delete_with_retry(client, collection, stale)
+        for url in removed:
+            del manifest.articles[url]
+        manifest.stats["articles_removed"] = len(removed)
+        manifest.save()
+    publish_corpus_version(client, collection, manifest)
+
+    elapsed = time.time() - start_time
+    articles = checkpoint.articles_done - start_articles
+    vectors = checkpoint.vectors_done - start_vectors
+    return {
+        "collection": collection,
+        "articles": articles,
+        "vectors": vectors,
+        "seconds": round(elapsed, 2),
+        "articles_per_sec": round(articles / elapsed, 2) if elapsed else None,
+        "vectors_per_sec": round(vectors / elapsed, 2) if elapsed else None,
+        "articles_total": checkpoint.articles_done,
+        "vectors_total": checkpoint.vectors_done,
+        "changes": {key: manifest.stats[key] for key in (
+            "articles_new", "articles_changed", "articles_unchanged", "articles_removed",
+            "articles_not_modified", "chunks_unchanged", "points_deleted")},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert crawled articles into Qdrant")
+    parser.add_argument("input", type=str, help="all_articles.json (JSON array) or a .jsonl file")
+    parser.add_argument("--collection", type=str, default=COLLECTION, help="Target Qdrant collection")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="Characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP, help="Characters shared by adjacent chunks")
+    parser.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH, help="Chunks encoded per batch")
+    parser.add_argument("--embed-processes", type=int, default=0, help="Encoder processes (0 = encode in-process)")
+    parser.add_argument("--upsert-batch", type=int, default=INGEST_UPSERT_BATCH, help="Points per upsert request")
+    parser.add_argument("--upsert-workers", type=int, default=INGEST_UPSERT_WORKERS, help="Parallel upsert requests")
+    parser.add_argument("--checkpoint", type=str, help="Checkpoint file (default under .cache/ingest)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first article")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only embed new or changed chunks and delete articles missing from the input")
+    parser.add_argument("--manifest", type=str, help="Content hash manifest (default under .cache/ingest)")
+    args = parser.parse_args()
+
+    stats = ingest(
+        args.input, collection=args.collection, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+        embed_batch=args.embed_batch, upsert_batch=args.upsert_batch, upsert_workers=args.upsert_workers,
+        embed_processes=args.embed_processes, checkpoint_path=args.checkpoint, resume=not args.restart,
+        incremental=args.incremental, manifest_path=args.manifest,
+    )
+    print(json.dumps(stats, indent=2))
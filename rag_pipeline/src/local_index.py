@@ -0,0 +1,225 @@
+"""
+In-process vector index for the medical_data collection.
+
+The collection is exported once into a versioned snapshot directory:
+
+    snapshots/local_index/
+        CURRENT                 # name of the active version, replaced atomically
+        <version>/
+            manifest.json       # collection, count, dim, created_at
+            vectors.npy         # float32 (count, dim), L2-normalized, memory-mapped at load
+            payloads.jsonl      # one payload per row, same order as vectors.npy
+            ids.json            # Qdrant point ids, same order as vectors.npy
+            hnsw.bin            # optional HNSW graph (requires hnswlib)
+
+With VECTOR_BACKEND=local, retrieve_context answers top-k from this snapshot
+instead of calling Qdrant, and a watcher thread swaps in new versions as they
+appear. Export a snapshot from the repository root with:
+    python -m rag_pipeline.src.local_index --export
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from qdrant_client.http import models
+
+from .utils import logger, resources, COLLECTION, ERROR_COUNT
+
+try:
+    import hnswlib
+except ImportError:  # Exact search over the memory-mapped matrix is used instead
+    hnswlib = None
+
+LOCAL_INDEX_DIR = Path(os.getenv(
+    "LOCAL_INDEX_DIR", str(Path(__file__).parent.parent.parent / "snapshots" / "local_index")
+))
+LOCAL_INDEX_REFRESH_INTERVAL = float(os.getenv("LOCAL_INDEX_REFRESH_INTERVAL", "30"))
+# HNSW build/search parameters
+HNSW_M = int(os.getenv("LOCAL_INDEX_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF = int(os.getenv("LOCAL_INDEX_HNSW_EF", "64"))
+
+
+class IndexSnapshot:
+    """One immutable, loaded snapshot version"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.version = path.name
+        self.manifest = json.loads((path / "manifest.json").read_text(encoding="utf-8"))
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.ids = json.loads((path / "ids.json").read_text(encoding="utf-8"))
+        with open(path / "payloads.jsonl", encoding="utf-8") as f:
+            self.payloads = [json.loads(line) for line in f]
+        if not (len(self.ids) == len(self.payloads) == self.vectors.shape[0]):
+            raise ValueError(f"Snapshot {path} is inconsistent: "
+                             f"{self.vectors.shape[0]} vectors, {len(self.ids)} ids, {len(self.payloads)} payloads")
+
+        self.graph = None
+        # ef is a setting on the shared graph, so set_ef + knn_query must not interleave
+        self._graph_lock = threading.Lock()
+        graph_path = path / "hnsw.bin"
+        if hnswlib is not None and graph_path.exists():
+            self.graph = hnswlib.Index(space="cosine", dim=self.vectors.shape[1])
+            self.graph.load_index(str(graph_path), max_elements=self.vectors.shape[0])
+            self.graph.set_ef(HNSW_EF)
+
+    def search(self, query, limit, score_threshold=None, ef=None, exact=False):
+        vec = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec = vec / norm
+        limit = min(limit, self.vectors.shape[0])
+        if limit <= 0:
+            return []
+
+        if self.graph is not None and not exact:
+            with self._graph_lock:
+                self.graph.set_ef(max(ef or HNSW_EF, limit))
+                labels, distances = self.graph.knn_query(vec, k=limit)
+            rows, scores = labels[0], 1.0 - distances[0]
+        else:
+            all_scores = self.vectors @ vec
+            rows = np.argpartition(-all_scores, limit - 1)[:limit]
+            rows = rows[np.argsort(-all_scores[rows])]
+            scores = all_scores[rows]
+
+        points = []
+        for row, score in zip(rows, scores):
+            if score_threshold is not None and score < score_threshold:
+                continue
+            points.append(models.ScoredPoint(
+                id=self.ids[int(row)], version=0, score=float(score), payload=self.payloads[int(row)]
+            ))
+        return points
+
+
+class LocalVectorIndex:
+    """Serves query_points() from the active snapshot and refreshes it atomically"""
+
+    def __init__(self, root=LOCAL_INDEX_DIR):
+        self.root = Path(root)
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def version(self):
+        """Version of the active snapshot, None until one is loaded"""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
+
+    def _current_version(self):
+        pointer = self.root / "CURRENT"
+        return pointer.read_text(encoding="utf-8").strip() if pointer.exists() else None
+
+    def refresh(self) -> bool:
+        """Load the version named in CURRENT if it differs from the active one"""
+        version = self._current_version()
+        if version is None or (self._snapshot is not None and self._snapshot.version == version):
+            return False
+        try:
+            start_time = time.time()
+            snapshot = IndexSnapshot(self.root / version)
+        except Exception as e:
+            ERROR_COUNT.labels(error_type="local_index_load").inc()
+            logger.error(f"Failed to load local index snapshot '{version}': {e}")
+            return False
+        # Readers keep using the old snapshot object until this reference swap
+        with self._lock:
+            self._snapshot = snapshot
+        logger.info(f"Local index snapshot '{version}' loaded: {snapshot.vectors.shape[0]} vectors, "
+                    f"{'HNSW' if snapshot.graph is not None else 'exact'} search, {time.time() - start_time:.2f}s")
+        return True
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Local index refresh failed: {e}")
+
+    def start(self, interval=LOCAL_INDEX_REFRESH_INTERVAL):
+        self.refresh()
+        if self._snapshot is None:
+            raise RuntimeError(f"No local index snapshot found in {self.root}")
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name="local-index-watcher", daemon=True)
+            self._watcher.start()
+
+    def query_points(self, query, limit=10, score_threshold=None, ef=None, exact=False) -> models.QueryResponse:
+        """Same result shape as QdrantClient.query_points"""
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError("Local index is not loaded")
+        return models.QueryResponse(points=snapshot.search(query, limit, score_threshold, ef, exact))
+
+
+def export_snapshot(root=LOCAL_INDEX_DIR, collection=COLLECTION, batch_size=256) -> Path:
+    """Scroll the Qdrant collection into a new snapshot version and point CURRENT at it"""
+    root = Path(root)
+    version = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = root / version
+    path.mkdir(parents=True, exist_ok=False)
+
+    ids, vectors = [], []
+    offset = None
+    with open(path / "payloads.jsonl", "w", encoding="utf-8") as payload_file:
+        while True:
+            records, offset = resources.client.scroll(
+                collection_name=collection, limit=batch_size, offset=offset,
+                with_payload=True, with_vectors=True,
+            )
+            for record in records:
+                ids.append(record.id if isinstance(record.id, int) else str(record.id))
+                vectors.append(np.asarray(record.vector, dtype=np.float32))
+                payload_file.write(json.dumps(record.payload or {}, ensure_ascii=False) + "\n")
+            logger.info(f"Exported {len(ids)} points from '{collection}'")
+            if offset is None:
+                break
+
+    matrix = np.stack(vectors)
+    matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+    np.save(path / "vectors.npy", matrix)
+    (path / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+
+    if hnswlib is not None:
+        graph = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        graph.init_index(max_elements=matrix.shape[0], ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        graph.add_items(matrix, np.arange(matrix.shape[0]))
+        graph.save_index(str(path / "hnsw.bin"))
+    else:
+        logger.warning("hnswlib is not installed, snapshot will use exact search")
+
+    (path / "manifest.json").write_text(json.dumps({
+        "collection": collection,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "created_at": datetime.now().isoformat(),
+    }, indent=2), encoding="utf-8")
+
+    # Publish the new version atomically
+    pointer_tmp = root / "CURRENT.tmp"
+    pointer_tmp.write_text(version, encoding="utf-8")
+    os.replace(pointer_tmp, root / "CURRENT")
+    logger.info(f"Local index snapshot '{version}' published with {matrix.shape[0]} vectors")
+    return path
+
+
+local_index = LocalVectorIndex()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Qdrant collection as a local index snapshot")
+    parser.add_argument("--export", action="store_true", help="Export a new snapshot and make it current")
+    parser.add_argument("--root", type=str, default=str(LOCAL_INDEX_DIR), help="Snapshot root directory")
+    args = parser.parse_args()
+    if args.export:
+        export_snapshot(args.root)
@@ -1,26 +1,47 @@
 import json
+import hmac
 import time
+import asyncio
 import threading
+from typing import Optional
 from pydantic import BaseModel
 from .model_setup import load_model
-from fastapi import FastAPI, HTTPException
-from .rag_pipeline import generate_answer_stream
-from fastapi.responses import StreamingResponse, Response
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from fastapi import FastAPI, HTTPException, Request
+from .rag_pipeline import generate_answer_stream, create_rag_chain_with_memory
+from .embedding_cache import query_embedding_cache
+from .embedding_batcher import embedding_batcher
+from .database.postgres_memory import init_database, get_async_pool, aclose_pools
+from .admission import admission_controller, AdmittedStreamingResponse
+from .local_index import local_index
+from .retrieval_profiles import RETRIEVAL_PROFILES
+from .reranker import reranker, RERANK_ENABLED
+from .sparse_index import sparse_index, HYBRID_SEARCH
+from .profiler import profiler, ProfilerBusy, DEBUG_TOKEN, PROFILE_MAX_SECONDS, PROFILE_DEFAULT_INTERVAL_MS
+from .sse import (encode_legacy_stream, encode_delta_stream,
+                  LEGACY_STREAM_VERSION, DELTA_STREAM_VERSION, SUPPORTED_STREAM_VERSIONS)
+from fastapi.responses import Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from prometheus_client.openmetrics import exposition as openmetrics
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from .utils import (DEFAULT_MODEL, logger, tracer, 
+from .utils import (DEFAULT_MODEL, logger, tracer, resources,
                    REQUEST_COUNT, LATENCY, MODEL_LOAD_TIME, 
-                   ERROR_COUNT, monitor_memory_usage)
+                   ERROR_COUNT, VECTOR_BACKEND, monitor_memory_usage, trace_exemplar)
 
 
 class ChatRequest(BaseModel):
     message: str
     session_id: str = "default"
+    # 1 = legacy per-chunk frames, 2 = batched SSE deltas with one sources event
+    stream_version: int = LEGACY_STREAM_VERSION
+    # "fast", "balanced" or "accurate"; None uses RETRIEVAL_PROFILE
+    retrieval_profile: Optional[str] = None
 
 class ModelState:
     def __init__(self):
         self.llm_loaded = False 
         self.model = None
+        # Built once per process and shared by all requests
+        self.chain = None
 
 model_state = ModelState()
 app = FastAPI()
@@ -33,6 +54,7 @@ def load_llm(model_name=DEFAULT_MODEL):
         try:
             logger.info(f"Attempting to load model: {model_name}")
             model_state.model = load_model(model_name, streaming=True)
+            model_state.chain = create_rag_chain_with_memory(model_state.model)
             model_state.llm_loaded = True
             span.set_attribute("model.loaded", True)
             
@@ -58,61 +80,128 @@ async def startup_event():
     memory_thread.start()
     logger.info("📊 Memory monitoring started")
     
-    # Initialize database first
-    try:
-        from .database.postgres_memory import init_database
-        init_database()
-    except ImportError:
-        from database.postgres_memory import init_database
-        init_database()
+    # Load Qdrant clients and the embedder before taking traffic
+    resources.init()
+    if VECTOR_BACKEND == "local":
+        # Serve retrieval from the exported snapshot and pick up new versions
+        local_index.start()
+    if RERANK_ENABLED:
+        # Load the cross-encoder now rather than on the first request's budget
+        reranker.model
+    if HYBRID_SEARCH and sparse_index.available:
+        # Same for the BM25 index, which would otherwise load inside the hybrid search budget
+        sparse_index.load()
+    
+    # Initialize database
+    init_database()
+    await get_async_pool()
     
     # Then load the model
     load_llm()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Shutting down FastAPI server...")
+    # Persist query embeddings so the next start is warm
+    query_embedding_cache.save()
+    embedding_batcher.close()
+    await aclose_pools()
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     """Chat endpoint with PostgreSQL memory"""
     if not model_state.llm_loaded:
         logger.error("Model not loaded - rejecting chat request")
         raise HTTPException(status_code=503, detail="Model not loaded")
+    if request.stream_version not in SUPPORTED_STREAM_VERSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream_version {request.stream_version}")
+    if request.retrieval_profile is not None and request.retrieval_profile not in RETRIEVAL_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval_profile {request.retrieval_profile}")
     
     # Track request metrics
     REQUEST_COUNT.inc()
     start_time = time.time()
     
+    # Wait for a generation slot or fail fast with 429/503 + Retry-After
+    await admission_controller.acquire(request.session_id)
+    
     try:
         logger.info(f"Processing chat request for session: {request.session_id}")
         logger.info(f"Message: {request.message[:50]}...")  # Log first 50 chars
         
-        def generate():
-            for chunk in generate_answer_stream(
-                request.message, 
-                model_state.model, 
-                session_id=request.session_id
-            ):
-                yield f"data: {json.dumps(chunk)}\n\n"
-            yield "data: [DONE]\n\n"
-            
-            # Record latency after streaming completes
+        chunks = generate_answer_stream(
+            request.message, 
+            model_state.chain, 
+            session_id=request.session_id,
+            retrieval_profile=request.retrieval_profile
+        )
+        if request.stream_version == DELTA_STREAM_VERSION:
+            frames = encode_delta_stream(chunks)
+            media_type = "text/event-stream"
+        else:
+            frames = encode_legacy_stream(chunks)
+            media_type = "text/plain"
+        
+        def finish():
+            # Recorded for aborted streams too, so disconnects do not hide slow requests
             request_time = time.time() - start_time
-            LATENCY.observe(request_time)
+            LATENCY.observe(request_time, exemplar=trace_exemplar())
+            admission_controller.release(request.session_id)
         
-        return StreamingResponse(
-            generate(),
-            media_type="text/plain",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+        return AdmittedStreamingResponse(
+            frames,
+            on_close=finish,
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
         )
     except Exception as e:
+        admission_controller.release(request.session_id)
         logger.error(f"Error processing chat request: {e}")
         ERROR_COUNT.labels(error_type="chat_request").inc()
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @app.get("/metrics")
-async def metrics():
-    """Prometheus metrics endpoint"""
+async def metrics(request: Request):
+    """Prometheus metrics endpoint; OpenMetrics (with trace exemplars) when the scraper asks for it"""
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return Response(openmetrics.generate_latest(REGISTRY), media_type=openmetrics.CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+@app.get("/debug/profile", include_in_schema=False)
+async def debug_profile(request: Request, mode: str = "cpu", seconds: float = 10.0,
+                        interval_ms: float = PROFILE_DEFAULT_INTERVAL_MS, top: int = 25, group_by: str = "traceback"):
+    """
+    Profile the live process: mode=cpu returns collapsed stacks for a
+    flamegraph, mode=memory the top tracemalloc allocation sites.
+    Requires `Authorization: Bearer $DEBUG_TOKEN`; 404 when DEBUG_TOKEN is unset.
+    """
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid debug token", headers={"WWW-Authenticate": "Bearer"})
+    if mode not in ("cpu", "memory"):
+        raise HTTPException(status_code=400, detail="mode must be 'cpu' or 'memory'")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+    if group_by not in ("traceback", "lineno", "filename"):
+        raise HTTPException(status_code=400, detail="group_by must be 'traceback', 'lineno' or 'filename'")
+
+    logger.warning(f"Starting {mode} profile for {seconds:g}s")
+    try:
+        # The sampler runs in a worker thread so the loop it observes keeps serving
+        if mode == "cpu":
+            collapsed = await asyncio.to_thread(profiler.cpu_profile, seconds, interval_ms)
+            return Response(collapsed, media_type="text/plain", headers={
+                "Content-Disposition": f'attachment; filename="cpu-{int(time.time())}.collapsed"'
+            })
+        return await asyncio.to_thread(profiler.memory_profile, seconds, top, group_by)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
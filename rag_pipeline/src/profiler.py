@@ -0,0 +1,127 @@
+"""
+On-demand profiling of the live serving process, used by /debug/profile.
+
+cpu:    samples every thread's Python stack with sys._current_frames() at a
+        fixed interval and returns collapsed stacks ("a;b;c 42" per line),
+        ready for flamegraph.pl or speedscope.
+memory: turns on tracemalloc for the window, diffs a snapshot taken at the
+        start against one taken at the end, and returns the top allocating
+        call sites.
+
+Nothing runs between requests: no sampler thread, no tracing hooks. Only one
+profile runs at a time.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from .utils import logger
+
+# Unset = the debug endpoint does not exist (404)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILE_DEFAULT_INTERVAL_MS", "10"))
+# Frames kept per tracemalloc traceback
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+
+_path_prefixes = sorted({p for p in sys.path if p}, key=len, reverse=True)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(filename: str) -> str:
+    for prefix in _path_prefixes:
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _frame_label(code) -> str:
+    # Collapsed-stack format reserves ';' and the trailing ' <count>'
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+
+    def cpu_profile(self, seconds: float, interval_ms=PROFILE_DEFAULT_INTERVAL_MS) -> str:
+        """Sample all threads for `seconds` and return collapsed stacks, hottest first"""
+        self._acquire()
+        try:
+            own_thread = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            samples = 0
+            interval = interval_ms / 1000
+            deadline = time.perf_counter() + seconds
+            next_sample = time.perf_counter()
+            while next_sample < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    if thread_id not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    labels.append(f"thread {names.get(thread_id, thread_id)}")
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                next_sample += interval
+                time.sleep(max(0.0, next_sample - time.perf_counter()))
+            logger.info(f"CPU profile: {samples} samples over {seconds:.1f}s, {len(stacks)} distinct stacks")
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+    def memory_profile(self, seconds: float, top=25, group_by="traceback") -> dict:
+        """Top call sites by memory allocated (net of frees) during the next `seconds`"""
+        self._acquire()
+        already_tracing = tracemalloc.is_tracing()
+        try:
+            if not already_tracing:
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            before = tracemalloc.take_snapshot()
+            time.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+            self._lock.release()
+
+        # Drop tracemalloc's own bookkeeping
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), group_by)
+        sites = [
+            {
+                "size_diff_bytes": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size_bytes": stat.size,
+                "traceback": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+            }
+            for stat in diff[:top]
+        ]
+        logger.info(f"Memory profile: {seconds:.1f}s window, {len(diff)} call sites")
+        return {
+            "seconds": seconds,
+            "group_by": group_by,
+            "net_allocated_bytes": sum(stat.size_diff for stat in diff),
+            "traced_current_bytes": traced_current,
+            "traced_peak_bytes": traced_peak,
+            "top": sites,
+        }
+
+
+profiler = Profiler()
@@ -2,10 +2,24 @@ from langchain.prompts import PromptTemplate
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.runnables import RunnableLambda
-from .utils import logger, COLLECTION, resources, tracer, VECTOR_SEARCH_TIME, ERROR_COUNT
+from .utils import (logger, COLLECTION, resources, tracer, VECTOR_SEARCH_TIME, ERROR_COUNT, TTFT, VECTOR_BACKEND,
+                    RETRIEVAL_BRANCH_TIME, RETRIEVAL_BRANCH_DROPPED, ENCODE_TIME, PROMPT_BUILD_TIME, LLM_TTFT,
+                    LLM_TIME, LLM_TOKENS_PER_SECOND, PROMPT_SIZE, PROMPT_TOKENS, COMPLETION_TOKENS, trace_exemplar)
 from .database.postgres_memory import get_by_session_id
+from .answer_cache import answer_cache, get_corpus_version, ANSWER_CACHE_ENABLED
+from .embedding_cache import query_embedding_cache
+from .embedding_batcher import embedding_batcher
+from .local_index import local_index
+from .retrieval_profiles import get_profile, PAYLOAD_FIELDS
+from .sparse_index import (sparse_index, reciprocal_rank_fusion, HYBRID_SEARCH, HYBRID_CANDIDATES,
+                           HYBRID_DENSE_BUDGET_MS, HYBRID_SPARSE_BUDGET_MS)
+from .reranker import reranker, RERANK_ENABLED, RERANK_CANDIDATES
+import asyncio
 import time
 
+# Cached answers are replayed in slices so clients still see a stream
+CACHED_ANSWER_CHUNK_CHARS = 32
+
 prompt = PromptTemplate(
     input_variables=["context", "question", "chat_history"],
     template=(
@@ -26,35 +40,108 @@ prompt = PromptTemplate(
     )
 )
 
-def retrieve_context(question: str, top_k=3) -> dict:
-    with tracer.start_as_current_span("retrieve_context") as span:
-        span.set_attribute("question.length", len(question))
-        span.set_attribute("top_k", top_k)
-        
-        # Encode question to vector
-        start_time = time.time()
-        with tracer.start_as_current_span("encode_question"):
-            vec = resources.embedder.encode(question).tolist()
-        
-        # Query vector database
+async def encode_question(question: str) -> list:
+    # CPU-bound encoding runs on the batcher thread, the loop only awaits its future
+    with tracer.start_as_current_span("encode_question"):
+        start_time = time.perf_counter()
+        vec = await query_embedding_cache.aget_or_compute(
+            question, lambda text: asyncio.wrap_future(embedding_batcher.submit(text))
+        )
+        ENCODE_TIME.observe(time.perf_counter() - start_time, exemplar=trace_exemplar())
+        return vec.tolist()
+
+async def dense_search(vec, top_k, profile) -> list:
+    """Nearest chunks from the configured vector backend"""
+    if VECTOR_BACKEND == "local":
+        with tracer.start_as_current_span("query_local_index") as query_span:
+            results = await asyncio.to_thread(
+                local_index.query_points, vec, top_k,
+                score_threshold=profile.score_threshold, ef=profile.hnsw_ef, exact=profile.exact
+            )
+            query_span.set_attribute("results.count", len(results.points))
+    else:
         with tracer.start_as_current_span("query_qdrant") as query_span:
-            results = resources.client.query_points(
+            results = await resources.aclient.query_points(
                 collection_name=COLLECTION,
                 query=vec,
                 limit=top_k,
-                with_payload=True
+                search_params=profile.search_params(),
+                score_threshold=profile.score_threshold,
+                with_payload=PAYLOAD_FIELDS
             )
             query_span.set_attribute("results.count", len(results.points))
+    return results.points
+
+async def _run_branch(branch: str, coro, budget_ms: float):
+    """Await one retrieval branch within its budget; None if it timed out or failed"""
+    start_time = time.time()
+    try:
+        return await asyncio.wait_for(coro, timeout=budget_ms / 1000)
+    except asyncio.TimeoutError:
+        RETRIEVAL_BRANCH_DROPPED.labels(branch=branch, reason="timeout").inc()
+        logger.warning(f"{branch} retrieval exceeded its {budget_ms:.0f}ms budget, dropping it")
+    except Exception as e:
+        RETRIEVAL_BRANCH_DROPPED.labels(branch=branch, reason="error").inc()
+        logger.error(f"{branch} retrieval failed: {e}")
+    finally:
+        RETRIEVAL_BRANCH_TIME.labels(branch=branch).observe(time.time() - start_time)
+    return None
+
+async def hybrid_search(question: str, vec, top_k, profile) -> list:
+    """Dense and BM25 search in parallel, merged with reciprocal rank fusion"""
+    with tracer.start_as_current_span("hybrid_search") as span:
+        candidates = max(top_k, HYBRID_CANDIDATES)
+        dense, sparse = await asyncio.gather(
+            _run_branch("dense", dense_search(vec, candidates, profile), HYBRID_DENSE_BUDGET_MS),
+            _run_branch("sparse", asyncio.to_thread(sparse_index.search, question, candidates), HYBRID_SPARSE_BUDGET_MS),
+        )
+        span.set_attribute("dense.count", -1 if dense is None else len(dense))
+        span.set_attribute("sparse.count", -1 if sparse is None else len(sparse))
+        if dense is None and sparse is None:
+            raise RuntimeError("Both dense and sparse retrieval failed")
+        if sparse:
+            # BM25 scores are not on the cosine scale the source filter expects
+            sparse = [point.model_copy(update={"score": 0.0}) for point in sparse]
+        return reciprocal_rank_fusion([points for points in (dense, sparse) if points], top_k)
+
+async def retrieve_context(question: str, top_k=None, query_vector=None, profile=None, hybrid=None, rerank=None) -> dict:
+    profile = get_profile(profile)
+    top_k = top_k or profile.top_k
+    hybrid = HYBRID_SEARCH if hybrid is None else hybrid
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    # Over-fetch so the reranker can pick distinct articles
+    fetch_k = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+    with tracer.start_as_current_span("retrieve_context") as span:
+        span.set_attribute("question.length", len(question))
+        span.set_attribute("top_k", top_k)
+        span.set_attribute("retrieval.profile", profile.name)
+        span.set_attribute("retrieval.hybrid", hybrid)
+        span.set_attribute("retrieval.rerank", rerank)
+        
+        # Encode question to vector (unless the caller already did)
+        vec = query_vector if query_vector is not None else await encode_question(question)
+        
+        # Query vector database, plus the BM25 index when hybrid search is on
+        start_time = time.time()
+        if hybrid and sparse_index.available:
+            points = await hybrid_search(question, vec, fetch_k, profile)
+        else:
+            points = await dense_search(vec, fetch_k, profile)
         
-        # Record vector search time
+        # Record vector search time (encoding is timed separately)
         search_time = time.time() - start_time
-        VECTOR_SEARCH_TIME.observe(search_time)
+        VECTOR_SEARCH_TIME.labels(profile=profile.name).observe(search_time, exemplar=trace_exemplar())
+        
+        if rerank:
+            points = await reranker.rerank(question, points)
         
         # Process results
         contexts = []
         sources = []
         seen_titles = set()
-        for i, pt in enumerate(results.points):
+        for i, pt in enumerate(points):
+            if len(contexts) >= top_k:
+                break
             title = pt.payload.get('metadata', {}).get('title', '') if pt.payload else ''
             if title in seen_titles:
                 continue
@@ -78,16 +165,47 @@ def retrieve_context(question: str, top_k=3) -> dict:
             'sources': sources
         }
 
-def create_rag_chain_with_memory(model):
-    def rag_logic(inputs):
+def record_llm_metrics(llm_start, first_token_time, streamed_chunks, usage):
+    """Generation time, throughput and token counts for one LLM call"""
+    end_time = time.perf_counter()
+    exemplar = trace_exemplar()
+    LLM_TIME.observe(end_time - llm_start, exemplar=exemplar)
+    # Without usage from the provider, each streamed chunk is counted as one token
+    completion_tokens = usage.get('output_tokens', streamed_chunks) if usage else streamed_chunks
+    COMPLETION_TOKENS.inc(completion_tokens, exemplar=exemplar)
+    if usage and usage.get('input_tokens'):
+        PROMPT_TOKENS.inc(usage['input_tokens'], exemplar=exemplar)
+        PROMPT_SIZE.observe(usage['input_tokens'])
+    if first_token_time is not None and completion_tokens > 1 and end_time > first_token_time:
+        LLM_TOKENS_PER_SECOND.observe((completion_tokens - 1) / (end_time - first_token_time))
+
+class RAGResult:
+    """Request-scoped output of the RAG chain: the streamed answer and its sources"""
+    def __init__(self):
+        self.answer = ""
+        self.sources = []
+        self.cached = False
+
+def create_rag_chain_with_memory(model, get_session_history=get_by_session_id):
+    """
+    Build the chain once and share it between requests. Each call must pass
+    its own RAGResult as inputs["result"]; nothing request-specific is kept
+    on the chain itself.
+    """
+    async def rag_logic(inputs):
         question = inputs["question"]
+        result = inputs["result"]
+        retrieval_profile = inputs.get("retrieval_profile")
         chat_history = inputs.get("chat_history", [])
         
         logger.info(f"Original question: {question}")
         logger.info(f"Chat history length: {len(chat_history)}")
         
         # Format chat history for context 
+        build_start = time.perf_counter()
         history_text = ""
+        # Cached answers are only reused when the history does not shape the question
+        related_history = False
         
         if chat_history:
             recent_history = chat_history[-4:]  
@@ -113,6 +231,7 @@ def create_rag_chain_with_memory(model):
             logger.info(f"Has followup words: {has_followup}")
             
             if has_followup and len(recent_history) >= 2:
+                related_history = True
                 # Get the last user question
                 for msg in reversed(recent_history):
                     if msg.__class__.__name__ == 'HumanMessage':
@@ -127,37 +246,74 @@ def create_rag_chain_with_memory(model):
         
         if not history_text:
             history_text = "Chưa có lịch sử cuộc trò chuyện."
+        build_time = time.perf_counter() - build_start
+        
+        query_vector = await encode_question(question)
+        use_cache = ANSWER_CACHE_ENABLED and not related_history
+        corpus_version = await get_corpus_version() if use_cache else None
+        # None and the default profile's name must share cache entries
+        profile_name = get_profile(retrieval_profile).name
         
-        retrieval_result = retrieve_context(question)
+        if use_cache:
+            cached = answer_cache.lookup(query_vector, corpus_version, profile_name)
+            if cached:
+                logger.info(f"Answer cache hit (similarity {cached['similarity']:.4f})")
+                result.sources = cached['sources']
+                result.answer = cached['answer']
+                result.cached = True
+                for i in range(0, len(result.answer), CACHED_ANSWER_CHUNK_CHARS):
+                    yield result.answer[i:i + CACHED_ANSWER_CHUNK_CHARS]
+                return
         
+        retrieval_result = await retrieve_context(question, query_vector=query_vector, profile=retrieval_profile)
+        result.sources = retrieval_result['sources']
+        
+        build_start = time.perf_counter()
         formatted_prompt = prompt.format(
             context=retrieval_result['context'], 
             question=question, 
             chat_history=history_text
         )
-        response = model.invoke(formatted_prompt)
+        PROMPT_BUILD_TIME.observe(build_time + time.perf_counter() - build_start)
         
-        global _last_sources
-        _last_sources = retrieval_result['sources']
+        # Forward tokens as soon as Groq emits them. RunnableWithMessageHistory
+        # aggregates the streamed chunks and saves the full answer afterwards.
+        llm_start = time.perf_counter()
+        first_token_time = None
+        streamed_chunks = 0
+        usage = None
+        try:
+            async for chunk in model.astream(formatted_prompt):
+                # Groq reports token usage on the final chunk
+                if getattr(chunk, 'usage_metadata', None):
+                    usage = chunk.usage_metadata
+                if chunk.content:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                        LLM_TTFT.observe(first_token_time - llm_start, exemplar=trace_exemplar())
+                    streamed_chunks += 1
+                    result.answer += chunk.content
+                    yield chunk.content
+        finally:
+            # Also counts generations cut short by a client disconnect
+            record_llm_metrics(llm_start, first_token_time, streamed_chunks, usage)
         
-        return response.content
+        if use_cache:
+            answer_cache.store(query_vector, result.answer, result.sources, corpus_version, profile_name)
 
     rag_runnable = RunnableLambda(rag_logic)
     
     chain_with_memory = RunnableWithMessageHistory(
         rag_runnable,
-        get_by_session_id,
+        get_session_history,
         input_messages_key="question",
         history_messages_key="chat_history",
     )
     
     return chain_with_memory
 
-# Global variable to store sources
-_last_sources = []
-
-def generate_answer_stream(question: str, model, session_id: str = "default"):
-    """Generate streaming answer with memory"""
+async def generate_answer_stream(question: str, chain, session_id: str = "default", retrieval_profile=None):
+    """Generate streaming answer with memory using the shared RAG chain"""
     
     with tracer.start_as_current_span("generate_answer_stream") as span:
         span.set_attribute("question.length", len(question))
@@ -166,26 +322,37 @@ def generate_answer_stream(question: str, model, session_id: str = "default"):
     try:
         logger.info(f"Processing question: {question} for session: {session_id}")
         
-        with tracer.start_as_current_span("create_rag_chain"):
-            chain = create_rag_chain_with_memory(model)
-        
-        with tracer.start_as_current_span("invoke_chain") as invoke_span:
-            result = chain.invoke(
-                {"question": question},
+        start_time = time.time()
+        result = RAGResult()
+        first_token = True
+        with tracer.start_as_current_span("stream_chain") as stream_span:
+            async for token in chain.astream(
+                {"question": question, "result": result, "retrieval_profile": retrieval_profile},
                 config={"configurable": {"session_id": session_id}}
-            )
-            invoke_span.set_attribute("result.length", len(result) if result else 0)
+            ):
+                if first_token:
+                    first_token = False
+                    ttft = time.time() - start_time
+                    TTFT.observe(ttft, exemplar=trace_exemplar())
+                    stream_span.set_attribute("ttft", ttft)
+                # Sources are only known to be relevant once the full answer is in
+                yield {
+                    'content': token,
+                    'sources': [],
+                    'type': 'content'
+                }
+            stream_span.set_attribute("result.length", len(result.answer))
+            stream_span.set_attribute("result.cached", result.cached)
         
-        logger.info(f"Generated response length: {len(result) if result else 0}")
+        logger.info(f"Generated response length: {len(result.answer)}")
         
-        global _last_sources
-        sources = _last_sources
+        sources = result.sources
         
         # Check if AI refused to answer or sources have low relevance
         should_show_sources = True
         
         # Check refusal in response
-        if isinstance(result, str) and "tôi không thể" in result.lower():
+        if "tôi không thể" in result.answer.lower():
             should_show_sources = False
         
         # Check if highest score < 0.7 (low relevance)
@@ -201,25 +368,6 @@ def generate_answer_stream(question: str, model, session_id: str = "default"):
         
         span.set_attribute("sources.count", len(sources))
         
-        # Check if result is a string
-        if isinstance(result, str):
-            # Stream character by character for better UX
-            for char in result:
-                yield {
-                    'content': char,
-                    'sources': sources,
-                    'type': 'content'
-                }
-        else:
-            # If result is not string, convert to string first
-            result_str = str(result)
-            for char in result_str:
-                yield {
-                    'content': char,
-                    'sources': sources,
-                    'type': 'content'
-                }
-        
         # Send sources at the end (only if should show them)
         if sources:
             yield {
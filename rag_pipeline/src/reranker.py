@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sentence_transformers import CrossEncoder
+
+from .utils import logger, tracer, CACHE_DIR, RERANK_TIME, RERANK_FALLBACKS
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_MODEL_DIR = CACHE_DIR / "reranker"
+# Candidates fetched from the vector search and scored in one batch
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Hard per-request budget; past it the original order is kept
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# Reranks scored at once; further requests keep the retrieval order instead of queueing
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+
+
+class CrossEncoderReranker:
+    """CPU cross-encoder that reorders retrieved chunks by (question, chunk) relevance"""
+
+    def __init__(self, model_name=RERANK_MODEL, model_dir=RERANK_MODEL_DIR, budget_ms=RERANK_BUDGET_MS,
+                 workers=RERANK_WORKERS):
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.budget_ms = budget_ms
+        self._model = None
+        self._lock = threading.Lock()
+        # Own threads, so a rerank that overruns its budget never holds up the default executor.
+        # A slot is held until the scoring thread finishes, not until the caller stops waiting.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        self._slots = threading.Semaphore(workers)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        start_time = time.time()
+        if self.model_dir.exists() and any(self.model_dir.iterdir()):
+            model = CrossEncoder(str(self.model_dir), device="cpu", max_length=RERANK_MAX_LENGTH)
+        else:
+            logger.info(f"Downloading reranker {self.model_name} to {self.model_dir}...")
+            model = CrossEncoder(self.model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+            model.save(str(self.model_dir))
+        logger.info(f"Reranker loaded in {time.time() - start_time:.2f}s")
+        return model
+
+    def score(self, question: str, passages: list):
+        pairs = [(question, passage) for passage in passages]
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    async def rerank(self, question: str, points: list) -> list:
+        """Reorder ScoredPoints by cross-encoder score, or return them unchanged if over budget"""
+        if len(points) < 2:
+            return points
+        with tracer.start_as_current_span("rerank") as span:
+            span.set_attribute("candidates.count", len(points))
+            if not self._slots.acquire(blocking=False):
+                RERANK_FALLBACKS.labels(reason="busy").inc()
+                span.set_attribute("rerank.fallback", "busy")
+                return points
+            passages = [pt.payload.get('page_content', '') if pt.payload else '' for pt in points]
+            start_time = time.time()
+            future = self._executor.submit(self.score, question, passages)
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                scores = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.budget_ms / 1000)
+            except asyncio.TimeoutError:
+                RERANK_FALLBACKS.labels(reason="timeout").inc()
+                span.set_attribute("rerank.fallback", "timeout")
+                logger.warning(f"Rerank exceeded its {self.budget_ms:.0f}ms budget, keeping retrieval order")
+                return points
+            except Exception as e:
+                RERANK_FALLBACKS.labels(reason="error").inc()
+                span.set_attribute("rerank.fallback", "error")
+                logger.error(f"Rerank failed, keeping retrieval order: {e}")
+                return points
+            finally:
+                RERANK_TIME.observe(time.time() - start_time)
+
+            order = sorted(range(len(points)), key=lambda i: scores[i], reverse=True)
+            return [points[i] for i in order]
+
+
+reranker = CrossEncoderReranker()
@@ -0,0 +1,50 @@
+import os
+
+from qdrant_client.http import models
+
+# Profile used when a request does not name one
+RETRIEVAL_PROFILE = os.getenv("RETRIEVAL_PROFILE", "balanced")
+
+# The only payload fields retrieve_context reads
+PAYLOAD_FIELDS = ["page_content", "metadata.title", "metadata.url"]
+
+
+class RetrievalProfile:
+    """
+    Search settings for one latency/recall trade-off.
+    hnsw_ef=None keeps the collection default; rescore/oversampling only
+    apply when the collection has quantized vectors.
+    """
+
+    def __init__(self, name, top_k=3, hnsw_ef=None, exact=False, rescore=None,
+                 oversampling=None, score_threshold=None):
+        self.name = name
+        self.top_k = top_k
+        self.hnsw_ef = hnsw_ef
+        self.exact = exact
+        self.rescore = rescore
+        self.oversampling = oversampling
+        self.score_threshold = score_threshold
+
+    def search_params(self) -> models.SearchParams:
+        quantization = None
+        if self.rescore is not None or self.oversampling is not None:
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, exact=self.exact, quantization=quantization)
+
+
+RETRIEVAL_PROFILES = {
+    # Small beam, no rescoring, drop weak matches early
+    "fast": RetrievalProfile("fast", top_k=3, hnsw_ef=32, rescore=False, score_threshold=0.5),
+    "balanced": RetrievalProfile("balanced", top_k=3, hnsw_ef=128, rescore=True, oversampling=2.0),
+    # Brute-force search over full-precision vectors
+    "accurate": RetrievalProfile("accurate", top_k=5, exact=True, rescore=True, oversampling=3.0),
+}
+
+if RETRIEVAL_PROFILE not in RETRIEVAL_PROFILES:
+    raise ValueError(f"Unknown RETRIEVAL_PROFILE '{RETRIEVAL_PROFILE}', expected one of {list(RETRIEVAL_PROFILES)}")
+
+
+def get_profile(name=None) -> RetrievalProfile:
+    """Resolve a profile name, falling back to the deployment default"""
+    return RETRIEVAL_PROFILES[name or RETRIEVAL_PROFILE]
@@ -0,0 +1,197 @@
+"""
+BM25 lexical index over the medical_data chunks.
+
+Vietnamese words are mostly multi-syllable ("sốt xuất huyết"), so each chunk
+is indexed by its syllables plus adjacent-syllable bigrams. BM25 weights are
+precomputed per (term, chunk) and stored as a term-major CSR matrix in a
+single compressed .npz, next to the projected payloads, so a sparse hit can
+be returned without a Qdrant lookup.
+
+Build from the repository root after the collection changes:
+    python -m rag_pipeline.src.sparse_index --build
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from qdrant_client.http import models
+
+from .utils import logger, resources, COLLECTION
+from .embedding_cache import normalize_query
+from .retrieval_profiles import PAYLOAD_FIELDS
+
+SPARSE_INDEX_PATH = Path(os.getenv(
+    "SPARSE_INDEX_PATH", str(Path(__file__).parent.parent.parent / "snapshots" / "sparse_index.npz")
+))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Hybrid retrieval: run BM25 next to the dense search and fuse with RRF
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+# Candidates fetched by each branch before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Per-branch latency budgets (ms); a branch that misses its budget is dropped
+HYBRID_DENSE_BUDGET_MS = float(os.getenv("HYBRID_DENSE_BUDGET_MS", "300"))
+HYBRID_SPARSE_BUDGET_MS = float(os.getenv("HYBRID_SPARSE_BUDGET_MS", "100"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_syllable = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Syllables and syllable bigrams of the normalized text"""
+    syllables = _syllable.findall(normalize_query(text))
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+def _encode_json(value) -> np.ndarray:
+    return np.frombuffer(json.dumps(value, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_json(array: np.ndarray):
+    return json.loads(array.tobytes().decode("utf-8"))
+
+
+def reciprocal_rank_fusion(result_lists, limit, k=RRF_K) -> list:
+    """
+    Merge ranked ScoredPoint lists by sum of 1 / (k + rank). A point keeps the
+    score from the first list it appears in, so pass the dense list first.
+    """
+    fused = {}
+    for points in result_lists:
+        for rank, point in enumerate(points):
+            entry = fused.setdefault(point.id, [0.0, point])
+            entry[0] += 1.0 / (k + rank + 1)
+    ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)
+    return [point for _, point in ranked[:limit]]
+
+
+class SparseIndex:
+    """In-memory BM25 index loaded from SPARSE_INDEX_PATH at startup (or lazily on first search)"""
+
+    def __init__(self, path=SPARSE_INDEX_PATH):
+        self.path = Path(path)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self._loaded or self.path.exists()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            start_time = time.time()
+            with np.load(self.path, allow_pickle=False) as data:
+                self.indptr = data["indptr"]
+                self.doc_ids = data["doc_ids"]
+                self.weights = data["weights"]
+                self.vocab = {term: i for i, term in enumerate(_decode_json(data["vocab"]))}
+                self.point_ids = _decode_json(data["point_ids"])
+                self.payloads = _decode_json(data["payloads"])
+            self._loaded = True
+            logger.info(f"Sparse index loaded: {len(self.point_ids)} chunks, {len(self.vocab)} terms, "
+                        f"{len(self.weights)} postings in {time.time() - start_time:.2f}s")
+
+    def search(self, question: str, limit=10) -> list:
+        """Top `limit` chunks by BM25 score, as ScoredPoints"""
+        self.load()
+        term_ids = {self.vocab[t] for t in tokenize(question) if t in self.vocab}
+        if not term_ids:
+            return []
+
+        scores = np.zeros(len(self.point_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        matched = np.count_nonzero(scores)
+        limit = min(limit, matched)
+        if limit == 0:
+            return []
+        rows = np.argpartition(-scores, limit - 1)[:limit]
+        rows = rows[np.argsort(-scores[rows])]
+        return [
+            models.ScoredPoint(id=self.point_ids[row], version=0, score=float(scores[row]), payload=self.payloads[row])
+            for row in rows
+        ]
+
+
+def build_sparse_index(path=SPARSE_INDEX_PATH, collection=COLLECTION, batch_size=512, k1=BM25_K1, b=BM25_B) -> Path:
+    """Scroll the collection's chunks and write the BM25 index to `path`"""
+    path = Path(path)
+    start_time = time.time()
+    vocab = {}
+    point_ids, payloads, doc_lengths = [], [], []
+    term_col, doc_col, tf_col = [], [], []
+
+    offset = None
+    while True:
+        records, offset = resources.client.scroll(
+            collection_name=collection, limit=batch_size, offset=offset,
+            with_payload=PAYLOAD_FIELDS, with_vectors=False,
+        )
+        for record in records:
+            payload = record.payload or {}
+            title = payload.get('metadata', {}).get('title', '')
+            tokens = tokenize(f"{title} {payload.get('page_content', '')}")
+            doc = len(point_ids)
+            for term, tf in Counter(tokens).items():
+                term_col.append(vocab.setdefault(term, len(vocab)))
+                doc_col.append(doc)
+                tf_col.append(tf)
+            point_ids.append(record.id if isinstance(record.id, int) else str(record.id))
+            payloads.append(payload)
+            doc_lengths.append(len(tokens))
+        logger.info(f"Tokenized {len(point_ids)} chunks from '{collection}'")
+        if offset is None:
+            break
+
+    terms = np.asarray(term_col, dtype=np.int32)
+    docs = np.asarray(doc_col, dtype=np.int32)
+    tf = np.asarray(tf_col, dtype=np.float32)
+    lengths = np.asarray(doc_lengths, dtype=np.float32)
+
+    # BM25 term weight, precomputed so a query only sums postings
+    df = np.bincount(terms, minlength=len(vocab))
+    idf = np.log(1 + (len(point_ids) - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = k1 * (1 - b + b * lengths[docs] / max(lengths.mean(), 1.0))
+    weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+
+    order = np.argsort(terms, kind="stable")
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp.npz")
+    np.savez_compressed(
+        tmp_path,
+        indptr=indptr,
+        doc_ids=docs[order],
+        weights=weights[order].astype(np.float32),
+        vocab=_encode_json(sorted(vocab, key=vocab.get)),
+        point_ids=_encode_json(point_ids),
+        payloads=_encode_json(payloads),
+    )
+    os.replace(tmp_path, path)
+    logger.info(f"Sparse index written to {path}: {len(point_ids)} chunks, {len(vocab)} terms, "
+                f"{path.stat().st_size / 1e6:.1f} MB in {time.time() - start_time:.1f}s")
+    return path
+
+
+sparse_index = SparseIndex()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the BM25 index used by hybrid retrieval")
+    parser.add_argument("--build", action="store_true", help="Rebuild the index from the Qdrant collection")
+    parser.add_argument("--path", type=str, default=str(SPARSE_INDEX_PATH), help="Output .npz file")
+    args = parser.parse_args()
+    if args.build:
+        build_sparse_index(args.path)
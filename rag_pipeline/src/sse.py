@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import time
+
+# Stream format v2: content is grouped into deltas that are flushed when the
+# buffer reaches SSE_MAX_DELTA_CHARS or SSE_FLUSH_INTERVAL seconds have passed
+SSE_MAX_DELTA_CHARS = int(os.getenv("SSE_MAX_DELTA_CHARS", "64"))
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.05"))
+
+LEGACY_STREAM_VERSION = 1
+DELTA_STREAM_VERSION = 2
+SUPPORTED_STREAM_VERSIONS = (LEGACY_STREAM_VERSION, DELTA_STREAM_VERSION)
+
+
+def format_event(data, event=None, event_id=None) -> str:
+    """Format one Server-Sent Event frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def encode_legacy_stream(chunks):
+    """Version 1: one `data:` frame per chunk followed by [DONE]"""
+    async for chunk in chunks:
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+_END_OF_STREAM = object()
+
+
+async def _drain(chunks, queue):
+    """Copy `chunks` into `queue`, then an exception it raised, then _END_OF_STREAM"""
+    try:
+        async for chunk in chunks:
+            queue.put_nowait(chunk)
+    except Exception as e:
+        queue.put_nowait(e)
+    queue.put_nowait(_END_OF_STREAM)
+
+
+async def encode_delta_stream(chunks, max_chars=None, flush_interval=None):
+    """
+    Version 2: batched `delta` events, a single `sources` event and a final
+    `done` event. Every event carries an increasing id. Buffered content is
+    flushed by size, and by a timer even when the model stalls between chunks.
+    """
+    max_chars = SSE_MAX_DELTA_CHARS if max_chars is None else max_chars
+    flush_interval = SSE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+
+    event_id = 0
+    buffer = []
+    buffered_chars = 0
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal event_id, buffer, buffered_chars, last_flush
+        event_id += 1
+        frame = format_event({"content": "".join(buffer)}, event="delta", event_id=event_id)
+        buffer = []
+        buffered_chars = 0
+        last_flush = time.monotonic()
+        return frame
+
+    # One task drains the source for its whole life: spans it opens with
+    # start_as_current_span are entered and exited in the same context
+    queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_drain(chunks, queue))
+    try:
+        while True:
+            timeout = max(0.0, last_flush + flush_interval - time.monotonic()) if buffer else None
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                # Nothing arrived before the flush interval ran out
+                yield flush()
+                continue
+            if chunk is _END_OF_STREAM:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+
+            if chunk.get('type') == 'sources':
+                if buffer:
+                    yield flush()
+                event_id += 1
+                yield format_event({"sources": chunk.get('sources', [])}, event="sources", event_id=event_id)
+                continue
+
+            content = chunk.get('content', '')
+            if not content:
+                continue
+            buffer.append(content)
+            buffered_chars += len(content)
+            if buffered_chars >= max_chars or time.monotonic() - last_flush >= flush_interval:
+                yield flush()
+    finally:
+        producer.cancel()
+
+    if buffer:
+        yield flush()
+    event_id += 1
+    yield format_event("[DONE]", event="done", event_id=event_id)
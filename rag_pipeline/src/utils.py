@@ -1,7 +1,8 @@
 import logging
 import os
+import platform
 from pathlib import Path
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from sentence_transformers import SentenceTransformer
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -32,9 +33,60 @@ tracer = trace.get_tracer("rag-pipeline", "0.1.0")
 REQUEST_COUNT = Counter("chatbot_requests_total", "Total requests to chatbot")
 LATENCY = Histogram("chatbot_request_latency_seconds", "Chatbot request latency")
 MODEL_LOAD_TIME = Histogram("chatbot_model_load_time_seconds", "Time to load the LLM model")
-VECTOR_SEARCH_TIME = Histogram("chatbot_vector_search_seconds", "Vector search latency")
+VECTOR_SEARCH_TIME = Histogram("chatbot_vector_search_seconds", "Vector search latency", ["profile"])
+RETRIEVAL_BRANCH_TIME = Histogram("chatbot_retrieval_branch_seconds", "Latency of each hybrid retrieval branch", ["branch"])
+RETRIEVAL_BRANCH_DROPPED = Counter("chatbot_retrieval_branch_dropped_total", "Hybrid retrieval branches dropped", ["branch", "reason"])
+RERANK_TIME = Histogram("chatbot_rerank_seconds", "Cross-encoder rerank latency",
+                        buckets=(0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0))
+RERANK_FALLBACKS = Counter("chatbot_rerank_fallbacks_total", "Reranks skipped in favour of the retrieval order", ["reason"])
 MEMORY_USAGE = Gauge("chatbot_memory_usage_bytes", "Memory usage in bytes")
 ERROR_COUNT = Counter("chatbot_errors_total", "Total number of errors", ["error_type"])
+ADMISSION_IN_FLIGHT = Gauge("chatbot_inflight_requests", "Chat generations currently admitted")
+ADMISSION_QUEUE_DEPTH = Gauge("chatbot_admission_queue_depth", "Chat requests waiting for a generation slot")
+ADMISSION_WAIT_TIME = Histogram("chatbot_admission_wait_seconds", "Time chat requests spent queued for admission")
+REJECTED_REQUESTS = Counter("chatbot_rejected_requests_total", "Chat requests shed by admission control", ["reason"])
+ANSWER_CACHE_HITS = Counter("chatbot_answer_cache_hits_total", "Semantic answer cache hits")
+ANSWER_CACHE_MISSES = Counter("chatbot_answer_cache_misses_total", "Semantic answer cache misses")
+ANSWER_CACHE_SIZE = Gauge("chatbot_answer_cache_bytes", "Approximate memory held by the semantic answer cache")
+EMBEDDING_CACHE_HITS = Counter("chatbot_embedding_cache_hits_total", "Query embedding cache hits")
+EMBEDDING_CACHE_MISSES = Counter("chatbot_embedding_cache_misses_total", "Query embedding cache misses")
+EMBEDDING_CACHE_HIT_RATIO = Gauge("chatbot_embedding_cache_hit_ratio", "Query embedding cache hit rate since start")
+EMBEDDING_CACHE_SIZE = Gauge("chatbot_embedding_cache_bytes", "Approximate memory held by the query embedding cache")
+EMBEDDING_BATCH_SIZE = Histogram("chatbot_embedding_batch_size", "Questions encoded per batched forward pass",
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+EMBEDDING_QUEUE_WAIT = Histogram("chatbot_embedding_queue_wait_seconds", "Time a question waits before its batch is encoded",
+                                 buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+DB_POOL_WAIT_TIME = Histogram("chatbot_db_pool_wait_seconds", "Time spent waiting for a pooled PostgreSQL connection", ["pool"],
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+DB_POOL_SIZE = Gauge("chatbot_db_pool_size", "Open connections in the PostgreSQL pool", ["pool"])
+DB_POOL_IN_USE = Gauge("chatbot_db_pool_in_use", "PostgreSQL pool connections currently borrowed", ["pool"])
+DB_POOL_WAITING = Gauge("chatbot_db_pool_requests_waiting", "Requests waiting for a PostgreSQL pool connection", ["pool"])
+TTFT = Histogram("chatbot_time_to_first_token_seconds", "Time from chat request to first streamed LLM token")
+# Per-stage breakdown of a /chat request
+ENCODE_TIME = Histogram("chatbot_encode_seconds", "Question embedding latency, including query cache hits",
+                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+HISTORY_LOAD_TIME = Histogram("chatbot_history_load_seconds", "Chat history window load latency", ["source"],
+                              buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+PROMPT_BUILD_TIME = Histogram("chatbot_prompt_build_seconds", "Time spent formatting history and the prompt",
+                              buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025))
+LLM_TTFT = Histogram("chatbot_llm_time_to_first_token_seconds", "Time from LLM call to its first streamed token",
+                     buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0))
+LLM_TIME = Histogram("chatbot_llm_generation_seconds", "Time from LLM call to its last streamed token",
+                     buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0))
+LLM_TOKENS_PER_SECOND = Histogram("chatbot_llm_tokens_per_second", "Completion tokens per second after the first token",
+                                  buckets=(10, 25, 50, 100, 200, 300, 500, 750, 1000, 1500))
+PROMPT_SIZE = Histogram("chatbot_prompt_size_tokens", "Prompt tokens per LLM call",
+                        buckets=(128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192))
+PROMPT_TOKENS = Counter("chatbot_prompt_tokens_total", "Prompt tokens sent to the LLM")
+COMPLETION_TOKENS = Counter("chatbot_completion_tokens_total", "Completion tokens streamed by the LLM")
+
+
+def trace_exemplar():
+    """Exemplar linking a metric sample to the active trace, or None outside a span"""
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return {"trace_id": format(span_context.trace_id, "032x")}
 
 # Memory monitoring function
 def monitor_memory_usage():
@@ -56,8 +108,34 @@ logger = logging.getLogger(__name__)
 # Constants
 DEFAULT_MODEL = "llama-3.1-8b-instant"
 COLLECTION = "medical_data"
+# Collection metadata key holding the content version written by ingest
+CORPUS_VERSION_KEY = "corpus_version"
 CACHE_DIR = Path(__file__).parent.parent.parent / ".cache"
 EMBEDDINGS_MODEL = CACHE_DIR / "model"
+# Embedding backend: "torch" (FP32 PyTorch) or "onnx-int8" (ONNX Runtime, dynamic int8)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Intra-op threads for the embedder, 0 = runtime default
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+def detect_quantization() -> str:
+    """Best ONNX Runtime int8 target this CPU supports: arm64, avx512_vnni, avx512 or avx2"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            flags = next((line.split(":", 1)[1].split() for line in f if line.startswith("flags")), [])
+    except OSError:
+        flags = []
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags and "avx512bw" in flags:
+        return "avx512"
+    return "avx2"
+
+# ONNX Runtime quantization target: arm64, avx2, avx512 or avx512_vnni (default: detected from the CPU)
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION") or detect_quantization()
+ONNX_MODEL_DIR = CACHE_DIR / "model-onnx"
+# Vector search backend: "qdrant" (network) or "local" (in-process snapshot, see local_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
 
 def download_model_if_needed():
     """
@@ -89,10 +167,39 @@ def download_model_if_needed():
         raise
 
 class Resources:
+    """
+    Qdrant clients and embedder, initialized on first use (or explicitly with
+    init() at startup) so that importing the package does not load the model.
+    """
     def __init__(self):
-        self.client = None
-        self.embedder = None
-        self._init_resources()
+        self._client = None
+        self._aclient = None
+        self._embedder = None
+        self._initialized = False
+        self._lock = threading.Lock()
+    
+    def init(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if not self._initialized:
+                self._init_resources()
+                self._initialized = True
+    
+    @property
+    def client(self):
+        self.init()
+        return self._client
+    
+    @property
+    def aclient(self):
+        self.init()
+        return self._aclient
+    
+    @property
+    def embedder(self):
+        self.init()
+        return self._embedder
     
     def _init_resources(self):
         """Initialize Qdrant client and embedder"""
@@ -104,10 +211,14 @@ class Resources:
             
             # Initialize Qdrant client
             qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
-            self.client = QdrantClient(url=qdrant_url)
+            self._client = QdrantClient(url=qdrant_url)
+            # Async client used by the /chat request path
+            self._aclient = AsyncQdrantClient(url=qdrant_url)
             
-            # Initialize embedder
-            self.embedder = SentenceTransformer(str(EMBEDDINGS_MODEL))
+            # Initialize embedder with the configured backend
+            from .embedding_backends import load_embedder
+            self._embedder = load_embedder(EMBEDDING_BACKEND)
+            logger.info(f"Embedding backend: {EMBEDDING_BACKEND}")
             
             logger.info("Khởi tạo resources thành công")
         except Exception as e:
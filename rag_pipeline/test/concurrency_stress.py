@@ -0,0 +1,105 @@
+"""
+Concurrency stress test for the shared RAG chain.
+
+Runs many chat sessions in parallel through generate_answer_stream with a fake
+LLM, retriever and in-memory history. Each session asks about its own topic,
+so any answer, source or history message that mentions another session's
+topic is cross-talk.
+
+Run from the repository root:
+    python -m rag_pipeline.test.concurrency_stress --sessions 200 --turns 2
+"""
+import argparse
+import asyncio
+import random
+import re
+import sys
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import AIMessageChunk
+
+from rag_pipeline.src import rag_pipeline
+from rag_pipeline.src.rag_pipeline import create_rag_chain_with_memory, generate_answer_stream
+
+TOPIC_PATTERN = re.compile(r"chủ đề-(\d+)")
+
+
+class FakeStreamingModel:
+    """Echoes the topic found in the question, one token at a time, with jitter"""
+
+    async def astream(self, formatted_prompt):
+        question = formatted_prompt.rsplit("Câu hỏi:", 1)[1]
+        topic = TOPIC_PATTERN.search(question).group(0)
+        for token in ["Trả lời", " cho ", topic, ".", " Hãy", " hỏi", " bác sĩ."]:
+            await asyncio.sleep(random.uniform(0, 0.005))
+            yield AIMessageChunk(content=token)
+
+
+async def fake_encode_question(question: str) -> list:
+    await asyncio.sleep(random.uniform(0, 0.002))
+    return [0.0]
+
+
+async def fake_retrieve_context(question: str, top_k=None, query_vector=None, profile=None) -> dict:
+    # Only the newest topic matters: follow-ups prepend the previous question
+    topic = TOPIC_PATTERN.findall(question)[-1]
+    await asyncio.sleep(random.uniform(0, 0.01))
+    return {
+        'context': f"Tài liệu về chủ đề-{topic}",
+        'sources': [{'title': f"chủ đề-{topic}", 'url': f"https://example.com/{topic}", 'score': 0.9}],
+    }
+
+
+async def run_session(chain, session_index: int, turns: int) -> list:
+    errors = []
+    topic = f"chủ đề-{session_index}"
+    for turn in range(turns):
+        content = ""
+        sources = []
+        async for chunk in generate_answer_stream(f"Triệu chứng của {topic}?", chain, session_id=f"stress-{session_index}"):
+            if chunk['type'] == 'content':
+                content += chunk['content']
+            elif chunk['type'] == 'sources':
+                sources = chunk['sources']
+
+        foreign = set(TOPIC_PATTERN.findall(content)) - {str(session_index)}
+        if topic not in content or foreign:
+            errors.append(f"session {session_index} turn {turn}: answer {content!r}")
+        if [source['title'] for source in sources] != [topic]:
+            errors.append(f"session {session_index} turn {turn}: sources {sources!r}")
+    return errors
+
+
+async def main(sessions: int, turns: int) -> int:
+    # Route the chain through the fakes; the answer cache would merge identical prompts
+    rag_pipeline.encode_question = fake_encode_question
+    rag_pipeline.retrieve_context = fake_retrieve_context
+    rag_pipeline.ANSWER_CACHE_ENABLED = False
+
+    histories = {}
+
+    def get_session_history(session_id: str):
+        return histories.setdefault(session_id, InMemoryChatMessageHistory())
+
+    chain = create_rag_chain_with_memory(FakeStreamingModel(), get_session_history=get_session_history)
+    results = await asyncio.gather(*(run_session(chain, i, turns) for i in range(sessions)))
+    errors = [error for session_errors in results for error in session_errors]
+
+    for session_id, history in histories.items():
+        index = session_id.split("-", 1)[1]
+        topics = {topic for msg in history.messages for topic in TOPIC_PATTERN.findall(msg.content)}
+        if topics != {index} or len(history.messages) != 2 * turns:
+            errors.append(f"{session_id}: history mixes topics {sorted(topics)} ({len(history.messages)} messages)")
+
+    for error in errors[:20]:
+        print(f"CROSS-TALK {error}")
+    print(f"{sessions} sessions x {turns} turns: {len(errors)} errors")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress the RAG chain with parallel sessions")
+    parser.add_argument("--sessions", type=int, default=200, help="Number of parallel chat sessions")
+    parser.add_argument("--turns", type=int, default=2, help="Questions asked per session")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.sessions, args.turns)))
@@ -0,0 +1,93 @@
+"""
+Dense-only vs hybrid (dense + BM25, RRF) retrieval benchmark.
+
+Needs a running Qdrant with the medical_data collection and a built sparse
+index (python -m rag_pipeline.src.sparse_index --build). Queries come from a
+JSONL file of {"question": ..., "relevant": [url, ...]}; without one, article
+titles sampled from the sparse index are used as questions and their own URL
+as the relevant document. Those title queries share their exact terms with
+the indexed chunks, so they overstate what BM25 adds: use a golden query file
+for numbers worth comparing.
+
+Run from the repository root:
+    python -m rag_pipeline.test.hybrid_benchmark --k 3 --samples 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from rag_pipeline.src.rag_pipeline import retrieve_context, encode_question
+from rag_pipeline.src.sparse_index import sparse_index
+
+
+def load_queries(path, samples, seed=0) -> list:
+    if path:
+        queries = []
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                query = json.loads(line)
+                # Recall and nDCG are undefined without a relevant document
+                if not query.get("question") or not query.get("relevant"):
+                    print(f"Warning: skipping {path}:{line_number}, it needs a question and at least one relevant URL")
+                    continue
+                queries.append(query)
+        if not queries:
+            raise ValueError(f"{path} has no usable queries")
+        return queries
+
+    print("Warning: no query file given, using article titles as queries. BM25 indexes those titles, "
+          "so the hybrid recall gain over dense is overstated; pass a golden query file.")
+    sparse_index.load()
+    by_title = {}
+    for payload in sparse_index.payloads:
+        metadata = payload.get('metadata', {})
+        if metadata.get('title') and metadata.get('url'):
+            by_title.setdefault(metadata['title'], metadata['url'])
+    titles = sorted(by_title)
+    random.Random(seed).shuffle(titles)
+    return [{"question": title, "relevant": [by_title[title]]} for title in titles[:samples]]
+
+
+async def run_mode(queries, k, hybrid) -> dict:
+    latencies, hits = [], []
+    for query in queries:
+        # Encode outside the timer so both modes measure retrieval only
+        vec = await encode_question(query["question"])
+        start_time = time.perf_counter()
+        result = await retrieve_context(query["question"], top_k=k, query_vector=vec, hybrid=hybrid)
+        latencies.append(time.perf_counter() - start_time)
+        urls = {source['url'] for source in result['sources']}
+        relevant = set(query["relevant"])
+        hits.append(len(urls & relevant) / len(relevant))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "mode": "hybrid" if hybrid else "dense",
+        f"recall@{k}": float(np.mean(hits)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
+
+
+async def main(args):
+    queries = load_queries(args.queries, args.samples)
+    print(f"{len(queries)} queries, k={args.k}")
+    # Warm up connections, the embedder and the sparse index
+    await retrieve_context(queries[0]["question"], top_k=args.k, hybrid=True)
+    for hybrid in (False, True):
+        print(json.dumps(await run_mode(queries, args.k, hybrid)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense-only and hybrid retrieval")
+    parser.add_argument("--queries", type=str, help="JSONL file with question and relevant URLs")
+    parser.add_argument("--samples", type=int, default=200, help="Title queries to sample without --queries (biased towards BM25)")
+    parser.add_argument("--k", type=int, default=3, help="Number of retrieved articles")
+    asyncio.run(main(parser.parse_args()))
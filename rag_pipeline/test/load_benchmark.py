@@ -0,0 +1,336 @@
+"""
+Offline end-to-end load benchmark for /chat.
+
+Serves the real FastAPI app on 127.0.0.1 with local stand-ins for every
+network dependency:
+  - a deterministic stub LLM in place of ChatGroq (configurable first-token
+    latency and token rate)
+  - an in-memory Qdrant seeded with synthetic medical_data chunks
+  - a SQLite chat history in place of PostgreSQL
+  - the cached embedding model, or a hash embedder when it is not on disk
+
+Concurrent sessions stream through the full HTTP/SSE path and the run reports
+p50/p95/p99 TTFT and total latency, tokens/sec and error rate as JSON. Exit
+status is non-zero when the error rate or p95 latency exceed the given limits,
+so it can gate CI.
+
+Run from the repository root:
+    python -m rag_pipeline.test.load_benchmark --sessions 64 --turns 3 --max-p95-ms 3000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessageChunk, message_to_dict, messages_from_dict
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+
+from rag_pipeline.src import rag_pipeline
+from rag_pipeline.src.main import app, model_state
+from rag_pipeline.src.rag_pipeline import create_rag_chain_with_memory
+from rag_pipeline.src.utils import resources, COLLECTION, EMBEDDINGS_MODEL
+
+TOPICS = ["sốt xuất huyết", "tiểu đường", "cao huyết áp", "viêm phổi", "đau dạ dày", "viêm gan B",
+          "thiếu máu", "hen suyễn", "đau nửa đầu", "sỏi thận", "viêm xoang", "mất ngủ"]
+ASPECTS = ["triệu chứng", "nguyên nhân", "cách điều trị", "cách phòng ngừa", "chế độ ăn", "biến chứng"]
+QUESTION_TEMPLATES = ["{aspect} của bệnh {topic} là gì?", "Làm sao biết mình bị {topic}?",
+                      "Bệnh {topic} có nguy hiểm không?", "Người bị {topic} nên làm gì?"]
+ANSWER_TEXT = ("Bệnh này thường khởi phát từ từ với các dấu hiệu không đặc hiệu. Người bệnh nên theo dõi "
+               "triệu chứng, nghỉ ngơi, uống đủ nước và ăn uống điều độ. Nếu triệu chứng kéo dài hoặc nặng "
+               "hơn, hãy đến cơ sở y tế gần nhất. Hãy tham khảo ý kiến bác sĩ để được tư vấn cụ thể.")
+
+PIPELINE_ERROR_PREFIX = "❓"
+
+
+class StubChatModel:
+    """
+    Deterministic stand-in for ChatGroq.astream: waits `first_token_ms`, then
+    emits `answer_tokens` tokens at `tokens_per_sec`. Jitter is seeded per
+    prompt so the same run replays the same timings.
+    """
+
+    def __init__(self, first_token_ms=300.0, tokens_per_sec=250.0, answer_tokens=150, jitter=0.1, error_rate=0.0):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.error_rate = error_rate
+        words = ANSWER_TEXT.split(" ")
+        self.tokens = [(" " if i else "") + words[i % len(words)] for i in range(answer_tokens)]
+
+    def _delay(self, rng, seconds):
+        return max(0.0, seconds * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    async def astream(self, formatted_prompt):
+        rng = random.Random(hashlib.md5(formatted_prompt.encode("utf-8")).digest())
+        await asyncio.sleep(self._delay(rng, self.first_token_ms / 1000))
+        if rng.random() < self.error_rate:
+            raise RuntimeError("Stub LLM injected failure")
+        interval = 1.0 / self.tokens_per_sec
+        for token in self.tokens:
+            yield AIMessageChunk(content=token)
+            await asyncio.sleep(self._delay(rng, interval))
+        # Like Groq, report usage on a final empty chunk (prompt tokens approximated by words)
+        input_tokens = len(formatted_prompt.split())
+        yield AIMessageChunk(content="", usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": len(self.tokens),
+            "total_tokens": input_tokens + len(self.tokens),
+        })
+
+
+class HashEmbedder:
+    """Offline stand-in for the SentenceTransformer: unit vectors from token hashes"""
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in text.lower().split():
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(text) for text in sentences])
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Local stand-in for the PostgreSQL history: one shared SQLite database, last `window` messages"""
+
+    def __init__(self, conn, lock, session_id: str, window: int = 4):
+        self.conn = conn
+        self.lock = lock
+        self.session_id = session_id
+        self.window = window
+
+    @property
+    def messages(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT message FROM (SELECT id, message FROM message_store WHERE session_id = ? "
+                "ORDER BY id DESC LIMIT ?) ORDER BY id", (self.session_id, self.window)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def add_messages(self, messages) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO message_store (session_id, message) VALUES (?, ?)",
+                [(self.session_id, json.dumps(message_to_dict(m), ensure_ascii=False)) for m in messages],
+            )
+
+    def clear(self) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM message_store WHERE session_id = ?", (self.session_id,))
+
+
+def sqlite_history_factory(path=":memory:"):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS message_store "
+                 "(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS message_store_session ON message_store (session_id, id)")
+    lock = threading.Lock()
+    return lambda session_id: SQLiteChatMessageHistory(conn, lock, session_id)
+
+
+def synthetic_chunks(articles: int, chunks_per_article: int, seed=0) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for article in range(articles):
+        topic = TOPICS[article % len(TOPICS)]
+        title = f"{topic.capitalize()}: những điều cần biết ({article})"
+        url = f"https://www.vinmec.com/vie/bai-viet/benchmark-{article}"
+        for chunk in range(chunks_per_article):
+            aspect = rng.choice(ASPECTS)
+            text = (f"{aspect.capitalize()} của bệnh {topic}. " +
+                    " ".join(rng.sample(ANSWER_TEXT.split(" "), 30)))
+            chunks.append({"page_content": text, "metadata": {"title": title, "url": url, "chunk": chunk}})
+    return chunks
+
+
+async def seed_qdrant(embedder, articles, chunks_per_article, batch_size=256) -> int:
+    """Fill an in-memory Qdrant with embedded synthetic chunks and install it in resources"""
+    chunks = synthetic_chunks(articles, chunks_per_article)
+    dimension = embedder.get_sentence_embedding_dimension()
+    aclient = AsyncQdrantClient(":memory:")
+    await aclient.create_collection(
+        COLLECTION, vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE)
+    )
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        vectors = embedder.encode([chunk["page_content"] for chunk in batch], normalize_embeddings=True)
+        await aclient.upsert(COLLECTION, points=[
+            models.PointStruct(id=start + i, vector=vector.tolist(), payload=payload)
+            for i, (vector, payload) in enumerate(zip(vectors, batch))
+        ])
+
+    resources._client = QdrantClient(":memory:")
+    resources._aclient = aclient
+    resources._embedder = embedder
+    resources._initialized = True
+    return len(chunks)
+
+
+def load_embedder(name: str):
+    if name == "hash" or (name == "auto" and not (EMBEDDINGS_MODEL.exists() and any(EMBEDDINGS_MODEL.iterdir()))):
+        return HashEmbedder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(str(EMBEDDINGS_MODEL if name == "auto" else name), device="cpu")
+
+
+def make_question(rng) -> str:
+    template = rng.choice(QUESTION_TEMPLATES)
+    return template.format(aspect=rng.choice(ASPECTS).capitalize(), topic=rng.choice(TOPICS))
+
+
+async def run_turn(client, session_id, question, stream_version) -> dict:
+    """One /chat request; TTFT is measured to the first non-empty content frame"""
+    start_time = time.perf_counter()
+    ttft = None
+    tokens = 0
+    answer = ""
+    payload = {"message": question, "session_id": session_id, "stream_version": stream_version}
+    try:
+        async with client.stream("POST", "/chat", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return {"status": response.status_code, "latency": time.perf_counter() - start_time}
+            async for line in response.aiter_lines():
+                if not line.startswith("data: ") or line == "data: [DONE]" or line == 'data: "[DONE]"':
+                    continue
+                content = json.loads(line[6:]).get("content")
+                if content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start_time
+                    answer += content
+                    # Stub tokens are single words, so this holds for v1 frames and v2 deltas alike
+                    tokens += len(content.split())
+    except httpx.HTTPError as e:
+        return {"status": type(e).__name__, "latency": time.perf_counter() - start_time}
+    if answer.startswith(PIPELINE_ERROR_PREFIX):
+        # generate_answer_stream reports failures in-band with a 200
+        return {"status": "pipeline_error", "latency": time.perf_counter() - start_time}
+    return {"status": 200, "latency": time.perf_counter() - start_time, "ttft": ttft, "tokens": tokens}
+
+
+async def run_session(client, index, turns, stream_version, think_time, seed) -> list:
+    rng = random.Random(seed * 100003 + index)
+    results = []
+    for _ in range(turns):
+        results.append(await run_turn(client, f"bench-{seed}-{index}", make_question(rng), stream_version))
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, think_time))
+    return results
+
+
+def percentiles_ms(values) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    values = np.array(values) * 1000
+    return {f"p{q}": round(float(np.percentile(values, q)), 1) for q in (50, 95, 99)}
+
+
+def summarize(results, wall_time) -> dict:
+    ok = [r for r in results if r["status"] == 200 and r["ttft"] is not None]
+    statuses = {}
+    for r in results:
+        if r not in ok:
+            statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    tokens = sum(r["tokens"] for r in ok)
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / max(len(results), 1), 4),
+        "error_statuses": statuses,
+        "ttft_ms": percentiles_ms([r["ttft"] for r in ok]),
+        "latency_ms": percentiles_ms([r["latency"] for r in ok]),
+        "tokens_per_sec": round(tokens / wall_time, 1),
+        "tokens_per_sec_per_stream_p50": round(float(np.median([r["tokens"] / r["latency"] for r in ok])), 1) if ok else None,
+        "requests_per_sec": round(len(ok) / wall_time, 2),
+        "wall_time_s": round(wall_time, 2),
+    }
+
+
+async def main(args) -> int:
+    # Identical synthetic questions would otherwise be served from the answer cache
+    rag_pipeline.ANSWER_CACHE_ENABLED = args.answer_cache
+    embedder = load_embedder(args.embedder)
+    points = await seed_qdrant(embedder, args.articles, args.chunks_per_article)
+
+    model_state.model = StubChatModel(args.first_token_ms, args.tokens_per_sec, args.answer_tokens,
+                                      error_rate=args.llm_error_rate)
+    model_state.chain = create_rag_chain_with_memory(model_state.model, get_session_history=sqlite_history_factory())
+    model_state.llm_loaded = True
+
+    # Real HTTP on loopback: httpx's ASGITransport buffers whole responses, which hides TTFT
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    try:
+        limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            # Warm up the embedder and connection before timing
+            await run_turn(client, "bench-warmup", make_question(random.Random(0)), args.stream_version)
+            start_time = time.perf_counter()
+            sessions = await asyncio.gather(*(
+                run_session(client, i, args.turns, args.stream_version, args.think_time, args.seed)
+                for i in range(args.sessions)
+            ))
+            wall_time = time.perf_counter() - start_time
+    finally:
+        server.should_exit = True
+        await server_task
+
+    summary = summarize([r for session in sessions for r in session], wall_time)
+    summary["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+    summary["config"].update({"points": points, "embedder": type(embedder).__name__})
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    failed = summary["error_rate"] > args.max_error_rate
+    if args.max_p95_ms and (summary["latency_ms"]["p95"] or 0) > args.max_p95_ms:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the /chat endpoint")
+    parser.add_argument("--sessions", type=int, default=32, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Questions asked per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between turns (s)")
+    parser.add_argument("--stream-version", type=int, default=2, choices=(1, 2), help="/chat stream format")
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="Stub LLM time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=250.0, help="Stub LLM decode rate per stream")
+    parser.add_argument("--answer-tokens", type=int, default=150, help="Tokens per stub answer")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of stub LLM calls that fail")
+    parser.add_argument("--articles", type=int, default=200, help="Synthetic articles in the Qdrant stand-in")
+    parser.add_argument("--chunks-per-article", type=int, default=5, help="Chunks per synthetic article")
+    parser.add_argument("--embedder", type=str, default="auto",
+                        help="'auto' (cached model, else hash), 'hash', or a SentenceTransformer path")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for questions and stub timings")
+    parser.add_argument("--output", type=str, help="Also write the JSON summary to this file")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Fail if the error rate is above this")
+    parser.add_argument("--max-p95-ms", type=float, default=0.0, help="Fail if p95 latency is above this (0 = off)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,232 @@
+"""
+Retrieval quality vs latency evaluation.
+
+Runs a golden set of questions through retrieve_context (or any retriever with
+the same call shape) under several configurations and reports recall@k, MRR,
+nDCG@k and latency percentiles side by side. Each run is written as JSON, and
+can be appended to a JSONL history to track the accuracy/latency Pareto
+frontier over time.
+
+The golden set is JSONL, one question per line:
+    {"question": "Triệu chứng sốt xuất huyết?", "relevant": ["https://www.vinmec.com/vie/bai-viet/..."]}
+Rows without a question or without relevant URLs are skipped with a warning.
+
+Configurations are a JSON list; every key except "name" is optional, and
+"hybrid" / "rerank" default to off regardless of the environment:
+    [{"name": "balanced", "profile": "balanced"},
+     {"name": "accurate+rerank", "profile": "accurate", "rerank": true, "k": 5},
+     {"name": "onnx", "embedder": "onnx-int8"},
+     {"name": "custom", "retriever": "my_module:my_retrieve"}]
+Without --configs every retrieval profile is evaluated dense-only, plus
+balanced with hybrid search and balanced with reranking.
+
+Run from the repository root:
+    python -m rag_pipeline.test.retrieval_eval --golden golden.jsonl --output eval.json --history eval_history.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import math
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from rag_pipeline.src.rag_pipeline import retrieve_context
+from rag_pipeline.src.embedding_batcher import embedding_batcher
+from rag_pipeline.src.embedding_backends import load_embedder
+from rag_pipeline.src.retrieval_profiles import RETRIEVAL_PROFILES, get_profile
+from rag_pipeline.src.utils import resources, EMBEDDING_BACKEND, VECTOR_BACKEND
+from rag_pipeline.test.hybrid_benchmark import load_queries
+
+DEFAULT_CONFIGS = [{"name": name, "profile": name, "hybrid": False, "rerank": False} for name in RETRIEVAL_PROFILES] + [
+    {"name": "balanced+hybrid", "profile": "balanced", "hybrid": True, "rerank": False},
+    {"name": "balanced+rerank", "profile": "balanced", "hybrid": False, "rerank": True},
+]
+
+
+def recall_at_k(urls, relevant, k) -> float:
+    return len(set(urls[:k]) & relevant) / len(relevant)
+
+
+def reciprocal_rank(urls, relevant) -> float:
+    for rank, url in enumerate(urls, start=1):
+        if url in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(urls, relevant, k) -> float:
+    """Binary-relevance nDCG; a URL only counts the first time it appears"""
+    seen = set()
+    dcg = 0.0
+    for rank, url in enumerate(urls[:k]):
+        if url in relevant and url not in seen:
+            dcg += 1.0 / math.log2(rank + 2)
+        seen.add(url)
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return dcg / ideal
+
+
+def resolve_retriever(path):
+    """'module:function' to a coroutine function, default retrieve_context"""
+    if not path:
+        return retrieve_context
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def use_embedder(backend):
+    """Swap the process-wide question encoder; vectors are encoded uncached below"""
+    resources.init()
+    resources._embedder = load_embedder(backend)
+    embedding_batcher._model = None
+
+
+async def evaluate_query(retriever, query, k, options) -> dict:
+    start_time = time.perf_counter()
+    # Encode through the batcher but not the query cache, so every config pays for encoding
+    vector = await asyncio.wrap_future(embedding_batcher.submit(query["question"]))
+    encoded_time = time.perf_counter()
+    result = await retriever(query["question"], top_k=k, query_vector=vector.tolist(), **options)
+    end_time = time.perf_counter()
+
+    urls = [source['url'] for source in result['sources']]
+    relevant = set(query["relevant"])
+    return {
+        "recall": recall_at_k(urls, relevant, k),
+        "mrr": reciprocal_rank(urls, relevant),
+        "ndcg": ndcg_at_k(urls, relevant, k),
+        "encode_s": encoded_time - start_time,
+        "retrieve_s": end_time - encoded_time,
+        "total_s": end_time - start_time,
+    }
+
+
+def latency_summary(values) -> dict:
+    values_ms = np.array(values) * 1000
+    return {f"p{q}": round(float(np.percentile(values_ms, q)), 2) for q in (50, 95, 99)} | {
+        "mean": round(float(values_ms.mean()), 2)
+    }
+
+
+async def evaluate_config(config, queries, batch_size) -> dict:
+    if config.get("embedder"):
+        use_embedder(config["embedder"])
+    retriever = resolve_retriever(config.get("retriever"))
+    k = config.get("k") or get_profile(config.get("profile")).top_k
+    # Stages a config does not ask for stay off, whatever HYBRID_SEARCH / RERANK_ENABLED say
+    options = {"profile": config.get("profile"), "hybrid": config.get("hybrid", False),
+               "rerank": config.get("rerank", False)}
+
+    # Warm up the encoder, connections and any lazily loaded index or model
+    await evaluate_query(retriever, queries[0], k, options)
+    rows = []
+    start_time = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        rows.extend(await asyncio.gather(*(evaluate_query(retriever, query, k, options) for query in batch)))
+    wall_time = time.perf_counter() - start_time
+
+    return {
+        "name": config.get("name") or json.dumps(config, sort_keys=True),
+        "config": config,
+        "k": k,
+        "queries": len(rows),
+        "recall@k": round(float(np.mean([row["recall"] for row in rows])), 4),
+        "mrr": round(float(np.mean([row["mrr"] for row in rows])), 4),
+        "ndcg@k": round(float(np.mean([row["ndcg"] for row in rows])), 4),
+        "latency_ms": latency_summary([row["total_s"] for row in rows]),
+        "encode_ms": latency_summary([row["encode_s"] for row in rows]),
+        "retrieve_ms": latency_summary([row["retrieve_s"] for row in rows]),
+        "queries_per_sec": round(len(rows) / wall_time, 2),
+    }
+
+
+def mark_pareto_frontier(results, metric):
+    """Flag configs that no other config beats on both `metric` and p95 latency"""
+    for result in results:
+        quality, latency = result[metric], result["latency_ms"]["p95"]
+        result["pareto"] = not any(
+            other[metric] >= quality and other["latency_ms"]["p95"] <= latency
+            and (other[metric] > quality or other["latency_ms"]["p95"] < latency)
+            for other in results if other is not result
+        )
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_fingerprint(queries) -> str:
+    encoded = json.dumps(queries, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def print_table(results, metric):
+    print(f"{'config':<24} {'k':>2} {'recall@k':>9} {'mrr':>7} {'ndcg@k':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        marker = " *" if r["pareto"] else ""
+        print(f"{r['name']:<24} {r['k']:>2} {r['recall@k']:>9.4f} {r['mrr']:>7.4f} {r['ndcg@k']:>7.4f} "
+              f"{r['latency_ms']['p50']:>8.1f} {r['latency_ms']['p95']:>8.1f} {r['latency_ms']['p99']:>8.1f}{marker}")
+    print(f"* = on the {metric} / p95 latency Pareto frontier")
+
+
+async def main(args):
+    queries = load_queries(args.golden, args.samples)
+    if args.limit:
+        queries = queries[:args.limit]
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as f:
+            configs = json.load(f)
+    print(f"{len(queries)} queries x {len(configs)} configs, batch size {args.batch_size}")
+
+    results = []
+    for config in configs:
+        results.append(await evaluate_config(config, queries, args.batch_size))
+        if config.get("embedder"):
+            # Later configs run with the deployment's encoder again
+            use_embedder(EMBEDDING_BACKEND)
+    mark_pareto_frontier(results, args.pareto_metric)
+    print_table(results, args.pareto_metric)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "golden": args.golden or f"title-sample:{args.samples}",
+        "dataset": dataset_fingerprint(queries),
+        "queries": len(queries),
+        "batch_size": args.batch_size,
+        "vector_backend": VECTOR_BACKEND,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "pareto_metric": args.pareto_metric,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency per configuration")
+    parser.add_argument("--golden", type=str, help="JSONL golden set with question and relevant URLs")
+    parser.add_argument("--samples", type=int, default=200, help="Title queries to sample when --golden is not given")
+    parser.add_argument("--limit", type=int, default=0, help="Only evaluate the first N questions")
+    parser.add_argument("--configs", type=str, help="JSON list of configurations (default: all profiles, hybrid, rerank)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Questions retrieved concurrently")
+    parser.add_argument("--pareto-metric", type=str, default="ndcg@k", choices=("recall@k", "mrr", "ndcg@k"),
+                        help="Quality metric for the Pareto frontier")
+    parser.add_argument("--output", type=str, help="Write this run's report as JSON")
+    parser.add_argument("--history", type=str, help="Append this run's report to a JSONL history")
+    asyncio.run(main(parser.parse_args()))
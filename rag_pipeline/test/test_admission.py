@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.admission import AdmissionController, AdmittedStreamingResponse
+
+
+def test_admits_up_to_limit_then_queues_in_order():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=1)
+        await controller.acquire("a")
+        order = []
+
+        async def queued(session_id):
+            await controller.acquire(session_id)
+            order.append(session_id)
+
+        waiters = [asyncio.create_task(queued("b")), asyncio.create_task(queued("c"))]
+        await asyncio.sleep(0)
+        assert order == [] and len(controller._waiters) == 2
+
+        controller.release("a")
+        await asyncio.sleep(0.01)
+        assert order == ["b"]
+        controller.release("b")
+        await asyncio.gather(*waiters)
+        assert order == ["b", "c"]
+        # The slot moved from session to session, it was never freed
+        assert controller._in_flight == 1
+
+        controller.release("c")
+        assert controller._in_flight == 0
+        assert not controller._active_sessions
+
+    asyncio.run(scenario())
+
+
+def test_second_request_for_busy_session_is_429():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=2, max_queue=2, queue_timeout=1)
+        await controller.acquire("a")
+        with pytest.raises(HTTPException) as excinfo:
+            await controller.acquire("a")
+        assert excinfo.value.status_code == 429
+        assert "Retry-After" in excinfo.value.headers
+
+        controller.release("a")
+        await controller.acquire("a")
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_503():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as excinfo:
+            await controller.acquire("c")
+        assert excinfo.value.status_code == 503
+        assert "Retry-After" in excinfo.value.headers
+
+        controller.release("a")
+        await waiter
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_is_503_and_frees_the_session():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.01)
+        await controller.acquire("a")
+        with pytest.raises(HTTPException) as excinfo:
+            await controller.acquire("b")
+        assert excinfo.value.status_code == 503
+        assert "b" not in controller._active_sessions
+        assert not controller._waiters
+
+        controller.release("a")
+        assert controller._in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert not controller._waiters and "b" not in controller._active_sessions
+        controller.release("a")
+        assert controller._in_flight == 0
+
+    asyncio.run(scenario())
+
+
+async def never_sent():
+    yield "data: never sent\n\n"
+
+
+def call_response(response, messages):
+    """Run an ASGI response against a client that sends `messages`, then waits forever"""
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.0"}}
+    asyncio.run(response(scope, receive, send))
+    return sent
+
+
+def test_disconnect_before_first_chunk_releases_the_slot():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+    asyncio.run(controller.acquire("s1"))
+
+    response = AdmittedStreamingResponse(never_sent(), on_close=lambda: controller.release("s1"))
+    call_response(response, [{"type": "http.disconnect"}])
+
+    assert controller._in_flight == 0
+    assert "s1" not in controller._active_sessions
+
+
+def test_finished_stream_releases_the_slot_once():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+    asyncio.run(controller.acquire("s1"))
+
+    response = AdmittedStreamingResponse(never_sent(), on_close=lambda: controller.release("s1"))
+    sent = call_response(response, [])
+
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+    assert controller._in_flight == 0
+    assert not controller._active_sessions
@@ -0,0 +1,80 @@
+import asyncio
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+
+from src import answer_cache as answer_cache_module
+from src.answer_cache import SemanticAnswerCache, get_corpus_version
+from src.ingest import Manifest, publish_corpus_version
+from src.utils import resources, CORPUS_VERSION_KEY
+
+QUESTION = np.array([1.0, 0.0, 0.0])
+SIMILAR = np.array([0.99, 0.05, 0.0])
+OTHER = np.array([0.0, 1.0, 0.0])
+SOURCES = [{"url": "https://example.com"}]
+
+
+def test_similar_question_hits_and_other_question_misses():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store(QUESTION, "answer", SOURCES, corpus_version="v1", profile="balanced")
+
+    hit = cache.lookup(SIMILAR, corpus_version="v1", profile="balanced")
+    assert hit["answer"] == "answer" and hit["sources"] == SOURCES
+    assert cache.lookup(OTHER, corpus_version="v1", profile="balanced") is None
+
+
+def test_corpus_version_change_clears_the_cache():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store(QUESTION, "answer", SOURCES, corpus_version="v1", profile="balanced")
+
+    assert cache.lookup(QUESTION, corpus_version="v2", profile="balanced") is None
+    # Going back to the old version does not bring old answers back
+    assert cache.lookup(QUESTION, corpus_version="v1", profile="balanced") is None
+
+
+def test_answers_are_not_shared_across_profiles():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store(QUESTION, "fast answer", SOURCES, corpus_version="v1", profile="fast")
+
+    assert cache.lookup(QUESTION, corpus_version="v1", profile="accurate") is None
+    assert cache.lookup(QUESTION, corpus_version="v1", profile="fast")["answer"] == "fast answer"
+
+
+def test_ingest_publishes_a_version_that_changes_with_content(tmp_path):
+    client = QdrantClient(":memory:")
+    client.create_collection("medical_data", vectors_config=models.VectorParams(size=3, distance=models.Distance.COSINE))
+    manifest = Manifest(tmp_path / "manifest.json", "medical_data", 1000, 100)
+
+    manifest.articles = {"u1": {"hash": "a", "chunks": ["c"]}}
+    first = publish_corpus_version(client, "medical_data", manifest)
+    assert client.get_collection("medical_data").config.metadata[CORPUS_VERSION_KEY] == first
+
+    manifest.articles = {"u1": {"hash": "b", "chunks": ["d"]}}
+    assert publish_corpus_version(client, "medical_data", manifest) != first
+
+
+def test_get_corpus_version_reads_collection_metadata(monkeypatch):
+    monkeypatch.delenv("CORPUS_VERSION", raising=False)
+    monkeypatch.setattr(answer_cache_module, "VECTOR_BACKEND", "qdrant")
+    monkeypatch.setattr(answer_cache_module, "COLLECTION", "medical_data")
+    monkeypatch.setattr(answer_cache_module, "_corpus_version", {"value": None, "checked_at": 0.0})
+
+    async def scenario():
+        client = AsyncQdrantClient(":memory:")
+        await client.create_collection(
+            "medical_data", vectors_config=models.VectorParams(size=3, distance=models.Distance.COSINE))
+        monkeypatch.setattr(resources, "_aclient", client)
+        monkeypatch.setattr(resources, "_initialized", True)
+
+        assert await get_corpus_version() == "points:0"
+        await client.update_collection("medical_data", metadata={CORPUS_VERSION_KEY: "abc"})
+        answer_cache_module._corpus_version["checked_at"] = 0.0
+        assert await get_corpus_version() == "ingest:abc"
+
+    asyncio.run(scenario())
+
+
+def test_pinned_corpus_version_wins(monkeypatch):
+    monkeypatch.setenv("CORPUS_VERSION", "release-7")
+    assert asyncio.run(get_corpus_version()) == "release-7"
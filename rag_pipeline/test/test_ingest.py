@@ -0,0 +1,134 @@
+import json
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.ingest import Manifest, Checkpoint, point_id
+
+CHUNK_SIZE = 40
+
+
+def make_manifest(tmp_path, chunk_size=CHUNK_SIZE):
+    return Manifest(tmp_path / "manifest.json", "medical_data", chunk_size, 0)
+
+
+def make_splitter(chunk_size=CHUNK_SIZE):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+
+
+def article(url, paragraphs, **extra):
+    return {"url": url, "title": url, "tag": "tag", "content": "\n\n".join(paragraphs), **extra}
+
+
+PARAGRAPHS = ["Sốt xuất huyết lây qua muỗi vằn.", "Triệu chứng gồm sốt cao và đau đầu.", "Cần uống đủ nước."]
+
+
+def ingested(tmp_path, articles):
+    """Manifest as it is left after a first run over `articles`"""
+    manifest = make_manifest(tmp_path)
+    for item in articles:
+        _, _, entry = manifest.plan(item, make_splitter(), incremental=True)
+        manifest.articles[item["url"]] = entry
+    manifest.save()
+    return make_manifest(tmp_path).load()
+
+
+def test_new_article_writes_every_chunk(tmp_path):
+    manifest = make_manifest(tmp_path)
+    changed, stale, entry = manifest.plan(article("u1", PARAGRAPHS), make_splitter(), incremental=True)
+
+    assert [pid for pid, _ in changed] == [point_id("u1", i) for i in range(len(PARAGRAPHS))]
+    assert stale == []
+    assert len(entry["chunks"]) == len(PARAGRAPHS)
+    assert manifest.stats["articles_new"] == 1
+
+
+def test_unchanged_article_is_skipped(tmp_path):
+    manifest = ingested(tmp_path, [article("u1", PARAGRAPHS)])
+
+    assert manifest.plan(article("u1", PARAGRAPHS), make_splitter(), incremental=True) is None
+    assert manifest.stats["articles_unchanged"] == 1
+    assert manifest.stats["chunks_unchanged"] == len(PARAGRAPHS)
+
+
+def test_changed_article_rewrites_changed_chunks_and_drops_extra_ones(tmp_path):
+    manifest = ingested(tmp_path, [article("u1", PARAGRAPHS)])
+    edited = [PARAGRAPHS[0], "Triệu chứng gồm sốt cao, phát ban."]
+
+    changed, stale, _ = manifest.plan(article("u1", edited), make_splitter(), incremental=True)
+
+    assert [pid for pid, _ in changed] == [point_id("u1", 1)]
+    assert stale == [point_id("u1", 2)]
+    assert manifest.stats["articles_changed"] == 1
+    assert manifest.stats["chunks_unchanged"] == 1
+
+
+def test_not_modified_flag_does_not_skip_the_hash_check(tmp_path):
+    manifest = ingested(tmp_path, [article("u1", PARAGRAPHS)])
+
+    assert manifest.plan(article("u1", PARAGRAPHS, unchanged=True), make_splitter(), incremental=True) is None
+    plan = manifest.plan(article("u1", PARAGRAPHS[:1], unchanged=True), make_splitter(), incremental=True)
+    assert plan is not None
+    assert plan[1] == [point_id("u1", 1), point_id("u1", 2)]
+    assert manifest.stats["articles_not_modified"] == 2
+
+
+def test_articles_missing_from_input_are_removed(tmp_path):
+    manifest = ingested(tmp_path, [article("u1", PARAGRAPHS), article("u2", PARAGRAPHS)])
+    manifest.plan(article("u1", PARAGRAPHS), make_splitter(), incremental=True)
+
+    assert list(manifest.removed()) == ["u2"]
+
+
+def test_splitter_params_change_rechunks_everything(tmp_path):
+    ingested(tmp_path, [article("u1", PARAGRAPHS)])
+    manifest = make_manifest(tmp_path, chunk_size=400).load()
+
+    plan = manifest.plan(article("u1", PARAGRAPHS), make_splitter(400), incremental=True)
+
+    assert plan is not None
+    changed, stale, entry = plan
+    assert [pid for pid, _ in changed] == [point_id("u1", 0)]
+    assert stale == [point_id("u1", 1), point_id("u1", 2)]
+    assert manifest.stats["articles_changed"] == 1
+
+
+def write_input(path, articles):
+    path.write_text("\n".join(json.dumps(a, ensure_ascii=False) for a in articles), encoding="utf-8")
+
+
+def test_checkpoint_resumes_for_the_same_input(tmp_path):
+    input_path = tmp_path / "articles.jsonl"
+    write_input(input_path, [article("u1", PARAGRAPHS)])
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data")
+    checkpoint.articles_done, checkpoint.vectors_done = 1, 3
+    checkpoint.save()
+
+    resumed = Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data").load()
+    assert (resumed.articles_done, resumed.vectors_done) == (1, 3)
+
+    other_collection = Checkpoint(tmp_path / "checkpoint.json", input_path, "other").load()
+    assert other_collection.articles_done == 0
+
+
+def test_checkpoint_resets_when_the_input_changes(tmp_path):
+    input_path = tmp_path / "articles.jsonl"
+    write_input(input_path, [article("u1", PARAGRAPHS)])
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data")
+    checkpoint.articles_done, checkpoint.vectors_done = 1, 3
+    checkpoint.save()
+
+    write_input(input_path, [article("u1", PARAGRAPHS), article("u2", PARAGRAPHS)])
+    reloaded = Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data").load()
+    assert (reloaded.articles_done, reloaded.vectors_done) == (0, 0)
+
+
+def test_checkpoint_clear_removes_the_file(tmp_path):
+    input_path = tmp_path / "articles.jsonl"
+    write_input(input_path, [article("u1", PARAGRAPHS)])
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data")
+    checkpoint.articles_done = 1
+    checkpoint.save()
+
+    checkpoint.clear()
+    assert not checkpoint.path.exists()
+    assert Checkpoint(tmp_path / "checkpoint.json", input_path, "medical_data").load().articles_done == 0
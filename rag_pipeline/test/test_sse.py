@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+
+from src.sse import encode_delta_stream, encode_legacy_stream, format_event
+
+
+async def chunks_from(items, delays=None):
+    for i, item in enumerate(items):
+        if delays:
+            await asyncio.sleep(delays[i])
+        yield item
+
+
+def collect(stream):
+    async def run():
+        return [frame async for frame in stream]
+    return asyncio.run(run())
+
+
+def parse(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    data = fields["data"]
+    return fields.get("id"), fields.get("event"), data if data == "[DONE]" else json.loads(data)
+
+
+def test_format_event():
+    assert format_event({"a": "é"}, event="delta", event_id=3) == 'id: 3\nevent: delta\ndata: {"a": "é"}\n\n'
+    assert format_event("[DONE]") == "data: [DONE]\n\n"
+
+
+def test_delta_stream_frame_sequence_and_ids():
+    items = [
+        {"type": "content", "content": "Sốt "},
+        {"type": "content", "content": "xuất "},
+        {"type": "content", "content": ""},
+        {"type": "sources", "sources": [{"url": "https://example.com"}]},
+        {"type": "content", "content": "huyết"},
+    ]
+    frames = [parse(f) for f in collect(encode_delta_stream(chunks_from(items), max_chars=64, flush_interval=60))]
+
+    assert frames == [
+        ("1", "delta", {"content": "Sốt xuất "}),
+        ("2", "sources", {"sources": [{"url": "https://example.com"}]}),
+        ("3", "delta", {"content": "huyết"}),
+        ("4", "done", "[DONE]"),
+    ]
+
+
+def test_delta_stream_flushes_by_size():
+    items = [{"type": "content", "content": "abcd"}] * 3
+    frames = [parse(f) for f in collect(encode_delta_stream(chunks_from(items), max_chars=8, flush_interval=60))]
+
+    assert [data for _, event, data in frames if event == "delta"] == [{"content": "abcdabcd"}, {"content": "abcd"}]
+    assert [event_id for event_id, _, _ in frames] == ["1", "2", "3"]
+
+
+def test_delta_stream_flushes_on_timer_while_the_source_stalls():
+    items = [{"type": "content", "content": "a"}, {"type": "content", "content": "b"}]
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        stream = encode_delta_stream(chunks_from(items, delays=[0, 0.5]), max_chars=64, flush_interval=0.02)
+        first = await stream.__anext__()
+        elapsed = loop.time() - start
+        rest = [frame async for frame in stream]
+        return first, elapsed, rest
+
+    first, elapsed, rest = asyncio.run(run())
+    assert parse(first) == ("1", "delta", {"content": "a"})
+    assert elapsed < 0.4
+    assert [parse(f) for f in rest] == [("2", "delta", {"content": "b"}), ("3", "done", "[DONE]")]
+
+
+def test_legacy_stream_is_one_frame_per_chunk():
+    items = [{"type": "content", "content": "a"}, {"type": "sources", "sources": []}]
+    frames = collect(encode_legacy_stream(chunks_from(items)))
+
+    assert frames == [f"data: {json.dumps(item)}\n\n" for item in items] + ["data: [DONE]\n\n"]
+
+
+def test_delta_stream_keeps_source_spans_in_one_context(caplog):
+    tracer = TracerProvider().get_tracer(__name__)
+
+    async def traced_chunks():
+        with tracer.start_as_current_span("stream_chain"):
+            for content in ("a", "b", "c"):
+                await asyncio.sleep(0.01)
+                yield {"type": "content", "content": content}
+
+    frames = collect(encode_delta_stream(traced_chunks(), max_chars=64, flush_interval=0.005))
+
+    assert "".join(parse(f)[2]["content"] for f in frames[:-1]) == "abc"
+    assert "Failed to detach context" not in caplog.text
+
+
+def test_delta_stream_reraises_source_errors():
+    async def failing_chunks():
+        yield {"type": "content", "content": "a"}
+        raise RuntimeError("llm down")
+
+    with pytest.raises(RuntimeError, match="llm down"):
+        collect(encode_delta_stream(failing_chunks(), max_chars=64, flush_interval=60))
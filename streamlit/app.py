@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import json
+import os
 import uuid
 
 st.set_page_config(
@@ -51,6 +52,27 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# 1 = legacy per-chunk frames, 2 = batched SSE deltas with one sources event
+STREAM_VERSION = int(os.getenv("CHAT_STREAM_VERSION", "2"))
+
+
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a text/event-stream response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=False):
+        line = line.decode('utf-8') if line else ""
+        if not line:
+            if data_lines:
+                yield event, "\n".join(data_lines)
+            event, data_lines = "message", []
+        elif line.startswith('event: '):
+            event = line[7:]
+        elif line.startswith('data: '):
+            data_lines.append(line[6:])
+    if data_lines:
+        yield event, "\n".join(data_lines)
+
+
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -109,7 +131,8 @@ if prompt := st.chat_input("Hỏi tôi về vấn đề sức khỏe..."):
                 "http://medical-fastapi:8000/chat",
                 json={
                     "message": prompt,
-                    "session_id": st.session_state.session_id
+                    "session_id": st.session_state.session_id,
+                    "stream_version": STREAM_VERSION
                 },
                 stream=True,
                 timeout=60  
@@ -119,22 +142,36 @@ if prompt := st.chat_input("Hỏi tôi về vấn đề sức khỏe..."):
                 # Clear thinking message and start showing response
                 thinking_placeholder.empty()
                 
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data = line[6:]
-                            if data == '[DONE]':
-                                break
-                            try:
-                                chunk = json.loads(data)
-                                if chunk.get('type') == 'content':
-                                    full_response += chunk.get('content', '')
-                                    message_placeholder.write(full_response + "▌")
-                                elif chunk.get('type') == 'sources':
-                                    sources = chunk.get('sources', [])
-                            except json.JSONDecodeError:
-                                continue
+                if STREAM_VERSION >= 2:
+                    for event, data in iter_sse_events(response):
+                        if event == 'done':
+                            break
+                        try:
+                            payload = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+                        if event == 'delta':
+                            full_response += payload.get('content', '')
+                            message_placeholder.write(full_response + "▌")
+                        elif event == 'sources':
+                            sources = payload.get('sources', [])
+                else:
+                    for line in response.iter_lines():
+                        if line:
+                            line = line.decode('utf-8')
+                            if line.startswith('data: '):
+                                data = line[6:]
+                                if data == '[DONE]':
+                                    break
+                                try:
+                                    chunk = json.loads(data)
+                                    if chunk.get('type') == 'content':
+                                        full_response += chunk.get('content', '')
+                                        message_placeholder.write(full_response + "▌")
+                                    elif chunk.get('type') == 'sources':
+                                        sources = chunk.get('sources', [])
+                                except json.JSONDecodeError:
+                                    continue
                 
                 # Final response without cursor
                 message_placeholder.write(full_response)